@@ -0,0 +1,95 @@
+"""
+OCR throughput and peak memory: PNG round trip vs. direct NumPy rasterization
+
+Each mode runs in a fresh subprocess so peak RSS is measured in isolation:
+
+    legacy   the previous extracted_text_using_ocr path: default-resolution pixmap,
+             encoded to PNG with pix.tobytes("png") and decoded again by PaddleOCR
+    direct   ocr_service.ocr_pages: pages rendered into NumPy arrays from the
+             pixmap sample buffer at OCR_DPI and passed to the engine in batches
+
+    python -m benchmarks.bench_ocr scanned.pdf --pages 20 --dpi 72 --batch-size 4
+
+Both modes include the one-off PaddleOCR model load in peak RSS but not in
+the timed section.
+"""
+import argparse
+import json
+import resource
+import subprocess
+import sys
+import time
+
+
+def run_legacy(pdf_path, pages):
+    import fitz
+    from paddleocr import PaddleOCR
+
+    ocr = PaddleOCR(use_angle_cls=True, lang="en")
+    pdf_document = fitz.open(pdf_path)
+    page_numbers = range(min(pages, len(pdf_document)))
+
+    start = time.perf_counter()
+    for page_num in page_numbers:
+        page = pdf_document.load_page(page_num)
+        pix = page.get_pixmap()
+        img_data = pix.tobytes("png")
+        ocr.ocr(img_data, cls=True)
+    elapsed = time.perf_counter() - start
+
+    pdf_document.close()
+    return len(page_numbers), elapsed
+
+
+def run_direct(pdf_path, pages, dpi, batch_size):
+    import fitz
+    from src.services import ocr_service
+
+    ocr_service._get_engine()
+    with fitz.open(pdf_path) as pdf_document:
+        page_numbers = range(min(pages, len(pdf_document)))
+
+    start = time.perf_counter()
+    ocr_service.ocr_pages(pdf_path, page_numbers, dpi=dpi, batch_size=batch_size)
+    elapsed = time.perf_counter() - start
+    return len(page_numbers), elapsed
+
+
+def child(args):
+    if args.mode == "legacy":
+        pages, elapsed = run_legacy(args.pdf, args.pages)
+    else:
+        pages, elapsed = run_direct(args.pdf, args.pages, args.dpi, args.batch_size)
+
+    # ru_maxrss is reported in kilobytes on Linux
+    peak_rss_mb = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+    print(json.dumps({"mode": args.mode, "pages": pages, "seconds": elapsed, "peak_rss_mb": peak_rss_mb}))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("pdf")
+    parser.add_argument("--pages", type=int, default=20)
+    parser.add_argument("--dpi", type=int, default=72)
+    parser.add_argument("--batch-size", type=int, default=4)
+    parser.add_argument("--mode", choices=["legacy", "direct"], help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.mode:
+        child(args)
+        return
+
+    print(f"{'mode':>8} {'pages':>6} {'pages/sec':>10} {'peak RSS MB':>12}")
+    for mode in ("legacy", "direct"):
+        output = subprocess.run(
+            [sys.executable, "-m", "benchmarks.bench_ocr", args.pdf, "--pages", str(args.pages),
+             "--dpi", str(args.dpi), "--batch-size", str(args.batch_size), "--mode", mode],
+            check=True, capture_output=True, text=True
+        ).stdout
+        result = json.loads(output.strip().splitlines()[-1])
+        print(f"{mode:>8} {result['pages']:>6} {result['pages'] / result['seconds']:>10.2f} "
+              f"{result['peak_rss_mb']:>12.1f}")
+
+
+if __name__ == "__main__":
+    main()
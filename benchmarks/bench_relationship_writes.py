@@ -0,0 +1,101 @@
+"""
+Relationship write cost as the graph grows
+
+Grows a synthetic graph of __Entity__ nodes in steps and, at every step, times a
+fixed number of relationship writes through GraphWriter. With the `entity_id`
+index in place the cost per relationship should stay flat; the unlabeled
+MATCH used before grows linearly with the node count.
+
+Run against a disposable Neo4j database:
+
+    python -m benchmarks.bench_relationship_writes --steps 1000 10000 50000 100000
+"""
+import argparse
+import time
+
+from neo4j import GraphDatabase
+
+from src.config.config import Config
+from src.services.graph_writer import GraphWriter
+
+BENCH_LABEL = "BenchEntity"
+
+UNLABELED_WRITE = """
+UNWIND $rows AS row
+MATCH (a {id: row.source_id}), (b {id: row.target_id})
+MERGE (a)-[r:BENCH_REL]->(b)
+SET r += row.properties
+"""
+
+
+def grow_graph(driver, current, target, batch_size):
+    rows = [{"id": f"bench-{i}", "properties": {}} for i in range(current, target)]
+    with driver.session() as session:
+        for start in range(0, len(rows), batch_size):
+            session.execute_write(GraphWriter._write_nodes, BENCH_LABEL, rows[start:start + batch_size])
+
+
+def relationship_rows(size, count):
+    step = max(size // count, 1)
+    return [
+        {"source_id": f"bench-{(i * step) % size}", "target_id": f"bench-{(i * step + 1) % size}", "properties": {}}
+        for i in range(count)
+    ]
+
+
+def time_writes(driver, rows, batch_size, labeled):
+    start = time.perf_counter()
+    with driver.session() as session:
+        for offset in range(0, len(rows), batch_size):
+            batch = rows[offset:offset + batch_size]
+            if labeled:
+                session.execute_write(GraphWriter._write_relationships, "BENCH_REL", batch)
+            else:
+                session.execute_write(lambda tx: tx.run(UNLABELED_WRITE, rows=batch).consume())
+    return (time.perf_counter() - start) / len(rows)
+
+
+def cleanup(driver, batch_size):
+    with driver.session() as session:
+        while True:
+            deleted = session.execute_write(
+                lambda tx: tx.run(
+                    f"MATCH (n:{BENCH_LABEL}) WITH n LIMIT $limit DETACH DELETE n RETURN count(*) AS deleted",
+                    limit=batch_size
+                ).single()["deleted"]
+            )
+            if not deleted:
+                break
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--steps", type=int, nargs="+", default=[1000, 10000, 50000])
+    parser.add_argument("--relationships", type=int, default=2000)
+    parser.add_argument("--batch-size", type=int, default=500)
+    parser.add_argument("--skip-unlabeled", action="store_true", help="only time the indexed write path")
+    args = parser.parse_args()
+
+    config = Config()
+    driver = GraphDatabase.driver(config.neo4j_uri, auth=(config.neo4j_username, config.neo4j_password))
+    with driver.session() as session:
+        session.run("CREATE INDEX `entity_id` IF NOT EXISTS FOR (n:__Entity__) ON (n.id)").consume()
+        session.run("CALL db.awaitIndexes()").consume()
+
+    print(f"{'nodes':>10} {'indexed us/rel':>16} {'unlabeled us/rel':>18}")
+    size = 0
+    try:
+        for target in sorted(args.steps):
+            grow_graph(driver, size, target, args.batch_size)
+            size = target
+            rows = relationship_rows(size, args.relationships)
+            indexed = time_writes(driver, rows, args.batch_size, labeled=True)
+            unlabeled = "-" if args.skip_unlabeled else f"{time_writes(driver, rows, args.batch_size, labeled=False) * 1e6:.1f}"
+            print(f"{size:>10} {indexed * 1e6:>16.1f} {unlabeled:>18}")
+    finally:
+        cleanup(driver, args.batch_size)
+        driver.close()
+
+
+if __name__ == "__main__":
+    main()
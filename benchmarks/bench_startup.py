@@ -0,0 +1,74 @@
+"""
+Process startup and import time
+
+Measures, each in a fresh interpreter:
+
+    import    wall time of importing a module and the slowest imports reported
+              by python -X importtime
+    startup   wall time of importing main, i.e. building the Flask app; the
+              handlers are created per process by init_services() on the
+              first request
+
+    python -m benchmarks.bench_startup --repeat 5 --top 15
+"""
+import argparse
+import statistics
+import subprocess
+import sys
+import time
+
+MODULES = [
+    "src.handlers.knowledge_graph_handler",
+    "src.handlers.query_handler",
+    "src.generators.answer_generator",
+    "src.services.storage_service",
+]
+
+
+def time_import(module, repeat):
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        subprocess.run([sys.executable, "-c", f"import {module}"], check=True, capture_output=True)
+        timings.append(time.perf_counter() - start)
+    return statistics.median(timings)
+
+
+def slowest_imports(module, top):
+    stderr = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        check=True, capture_output=True, text=True
+    ).stderr
+
+    rows = []
+    for line in stderr.splitlines():
+        if not line.startswith("import time:"):
+            continue
+        self_us, cumulative_us, name = line[len("import time:"):].split("|", 2)
+        if not cumulative_us.strip().isdigit():
+            continue
+        # Drop the separator space, nested imports keep their indentation
+        rows.append((int(cumulative_us), name[1:]))
+
+    # Only top-level packages, nested imports are already part of their parent's cumulative time
+    rows = [row for row in rows if not row[1].startswith(" ")]
+    return sorted(rows, reverse=True)[:top]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--top", type=int, default=10)
+    args = parser.parse_args()
+
+    print("Import time (median wall clock)")
+    for module in MODULES + ["main"]:
+        print(f"  {module:<45} {time_import(module, args.repeat) * 1000:>8.0f} ms")
+
+    print("\nSlowest top-level imports under main (cumulative)")
+    for cumulative_us, name in slowest_imports("main", args.top):
+        print(f"  {name:<45} {cumulative_us / 1000:>8.0f} ms")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,121 @@
+"""
+Upload peak memory and throughput: in-memory bytes vs. spooled file with staged blocks
+
+Each mode runs in a fresh subprocess so peak RSS is measured in isolation:
+
+    legacy   the previous route: file.read() into bytes, hashed and uploaded from a
+             BytesIO in a single call
+    spooled  StorageService.spool_upload (fixed-size reads, incremental SHA-256) and
+             upload_blob from the file as parallel staged blocks
+
+Runs against Azurite, the local Azure Storage emulator, by default:
+
+    docker run -p 10000:10000 mcr.microsoft.com/azure-storage/azurite azurite-blob --blobHost 0.0.0.0
+    python -m benchmarks.bench_upload --size-mb 200
+
+Only the blob path is measured; metadata extraction and MongoDB are left out.
+"""
+import argparse
+import hashlib
+import io
+import json
+import os
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+
+AZURITE_CONNECTION_STRING = "UseDevelopmentStorage=true"
+CONTAINER = "bench-upload"
+
+
+def container_client(connection_string, max_block_size, max_single_put_size):
+    from azure.core.exceptions import ResourceExistsError
+    from azure.storage.blob import BlobServiceClient
+
+    service = BlobServiceClient.from_connection_string(
+        connection_string, max_block_size=max_block_size, max_single_put_size=max_single_put_size
+    )
+    container = service.get_container_client(CONTAINER)
+    try:
+        container.create_container()
+    except ResourceExistsError:
+        pass
+    return container
+
+
+def run_legacy(path, container, args):
+    with open(path, "rb") as body:
+        start = time.perf_counter()
+        pdf_bytes = body.read()
+        document_hash = hashlib.sha256(pdf_bytes).hexdigest()
+        container.get_blob_client(f"legacy_{document_hash}").upload_blob(io.BytesIO(pdf_bytes), overwrite=True)
+        return time.perf_counter() - start
+
+
+def run_spooled(path, container, args):
+    from src.services.storage_service import StorageService
+
+    with open(path, "rb") as body:
+        start = time.perf_counter()
+        spooled, document_hash, size = StorageService.spool_upload(body, directory=tempfile.gettempdir())
+        try:
+            with open(spooled, "rb") as data:
+                container.get_blob_client(f"spooled_{document_hash}").upload_blob(
+                    data, length=size, overwrite=True, max_concurrency=args.concurrency
+                )
+        finally:
+            os.remove(spooled)
+        return time.perf_counter() - start
+
+
+def child(args):
+    container = container_client(args.connection_string, args.block_size_mb * 1024 * 1024, 8 * 1024 * 1024)
+    runner = run_legacy if args.mode == "legacy" else run_spooled
+    seconds = runner(args.file, container, args)
+    peak_rss_mb = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+    print(json.dumps({"seconds": seconds, "peak_rss_mb": peak_rss_mb}))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--file", help="file to upload; a random file of --size-mb is generated if omitted")
+    parser.add_argument("--size-mb", type=int, default=200)
+    parser.add_argument("--connection-string", default=os.getenv("AZURE_CONNECTION_STRING", AZURITE_CONNECTION_STRING))
+    parser.add_argument("--block-size-mb", type=int, default=4)
+    parser.add_argument("--concurrency", type=int, default=4)
+    parser.add_argument("--mode", choices=["legacy", "spooled"], help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.mode:
+        child(args)
+        return
+
+    generated = None
+    if not args.file:
+        generated = tempfile.NamedTemporaryFile(suffix=".bin", delete=False)
+        with generated:
+            for _ in range(args.size_mb):
+                generated.write(os.urandom(1024 * 1024))
+        args.file = generated.name
+
+    size_mb = os.path.getsize(args.file) / (1024 * 1024)
+    try:
+        print(f"{'mode':>8} {'MB':>8} {'MB/sec':>8} {'peak RSS MB':>12}")
+        for mode in ("legacy", "spooled"):
+            output = subprocess.run(
+                [sys.executable, "-m", "benchmarks.bench_upload", "--file", args.file,
+                 "--connection-string", args.connection_string, "--block-size-mb", str(args.block_size_mb),
+                 "--concurrency", str(args.concurrency), "--mode", mode],
+                check=True, capture_output=True, text=True
+            ).stdout
+            result = json.loads(output.strip().splitlines()[-1])
+            print(f"{mode:>8} {size_mb:>8.0f} {size_mb / result['seconds']:>8.1f} {result['peak_rss_mb']:>12.1f}")
+    finally:
+        if generated is not None:
+            os.remove(generated.name)
+
+
+if __name__ == "__main__":
+    main()
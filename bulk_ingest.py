@@ -0,0 +1,253 @@
+"""
+Offline bulk ingestion of a PDF archive into the knowledge graph
+
+Reuses KnowledgeGraphHandler for text extraction, chunking, LLM extraction and
+graph building, without the Flask app or the upload path:
+
+    parse      a process pool opens each PDF, extracts page text (OCR runs inline
+               in the worker) and splits it into chunks
+    extract    several documents are built at once in threads; their LLM calls
+               share the handler's bounded extraction pool
+    write      batched UNWIND transactions into Neo4j, or CSV files for
+               neo4j-admin database import with --csv-dir
+
+Every finished or failed document is appended to a JSONL checkpoint; a rerun with
+the same checkpoint skips the documents already done and retries the failed ones.
+Documents are named by their path relative to the source, and no document replaces
+another, so files with the same name in different directories are kept apart.
+
+    python bulk_ingest.py /data/archive --workers 8 --documents 4 --batch-size 2000
+    python bulk_ingest.py manifest.txt --csv-dir ./import
+    python bulk_ingest.py --create-indexes
+"""
+import argparse
+import hashlib
+import json
+import multiprocessing
+import os
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, ThreadPoolExecutor, wait
+from datetime import datetime
+
+from src.config.config import Config
+from src.config.logging_config import setup_logging
+
+config = Config()
+logger = setup_logging(config.logging_config)
+
+# Handler of a parse worker process, created by the pool initializer
+_parse_handler = None
+
+
+def _init_parse_worker():
+    global _parse_handler
+    from src.handlers.knowledge_graph_handler import KnowledgeGraphHandler
+    from src.services.ocr_service import OcrService
+
+    # Pool workers are daemonic and cannot start an OCR pool of their own
+    _parse_handler = KnowledgeGraphHandler(config, connect=False, ocr_service=OcrService(max_workers=0))
+
+
+def parse_document(path, filename):
+    """Read a PDF and return its hash and chunk texts. Runs in a parse worker."""
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(config.upload_read_size), b""):
+            digest.update(block)
+    # Pages are read from the file, OCR included, rather than from a copy in memory
+    chunks = [chunk.page_content for chunk in _parse_handler.iter_chunks(_parse_handler.iter_page_texts(path))]
+    return {
+        "path": path,
+        "hash": digest.hexdigest(),
+        "filename": filename,
+        "chunks": chunks,
+    }
+
+
+def source_base(source):
+    """Directory the input paths are named relative to: the source directory or the manifest's directory."""
+    return source if os.path.isdir(source) else os.path.dirname(os.path.abspath(source))
+
+
+def iter_input_paths(source):
+    """Yield the PDF paths of a directory (recursively, sorted) or of a manifest with one path per line."""
+    if os.path.isdir(source):
+        for root, dirs, files in os.walk(source):
+            dirs.sort()
+            for name in sorted(files):
+                if name.lower().endswith(".pdf"):
+                    yield os.path.join(root, name)
+        return
+
+    base = source_base(source)
+    with open(source, encoding="utf-8") as f:
+        for line in f:
+            line = line.strip()
+            if line and not line.startswith("#"):
+                yield line if os.path.isabs(line) else os.path.join(base, line)
+
+
+class Checkpoint:
+    """Append-only JSONL record of processed documents; the last entry for a path wins."""
+
+    def __init__(self, path):
+        self.path = path
+        self.done = set()
+        self.lock = threading.Lock()
+
+        if os.path.exists(path):
+            with open(path, encoding="utf-8") as f:
+                for line in f:
+                    try:
+                        entry = json.loads(line)
+                    except json.JSONDecodeError:
+                        # Last line of an interrupted run
+                        continue
+                    if entry.get("status") == "done":
+                        self.done.add(entry["path"])
+                    else:
+                        self.done.discard(entry["path"])
+
+        self.file = open(path, "a", encoding="utf-8")
+
+    def record(self, path, status, **details):
+        entry = {"path": path, "status": status, "at": datetime.utcnow().isoformat(), **details}
+        with self.lock:
+            self.file.write(json.dumps(entry) + "\n")
+            self.file.flush()
+            os.fsync(self.file.fileno())
+            if status == "done":
+                self.done.add(path)
+
+    def close(self):
+        self.file.close()
+
+
+def ingest_parsed(handler, parsed):
+    """
+    Extract and write the chunks of a parsed document through the handler's graph building.
+    No earlier version is replaced, so the graph of every other document is left alone.
+    """
+    from langchain_core.documents import Document
+
+    document = {"id": parsed["hash"], "filename": parsed["filename"], "documentId": None}
+    chunks = (Document(page_content=text) for text in parsed["chunks"])
+    return handler.create_knowledge_graph(chunks, document=document)
+
+
+def run(args):
+    from src.handlers.knowledge_graph_handler import KnowledgeGraphHandler
+    from src.services.csv_graph_writer import CsvGraphWriter
+
+    # Tuning for a long offline run, applied before the handler builds its pools
+    config.graph_write_batch_size = args.batch_size
+    config.extraction_concurrency = args.llm_concurrency
+    config.ingest_window_chunks = args.window
+
+    # Start the parse workers before the handler and its driver start any threads, in case they are forked
+    parse_pool = ProcessPoolExecutor(
+        max_workers=args.workers,
+        mp_context=multiprocessing.get_context(config.ocr_start_method),
+        initializer=_init_parse_worker
+    )
+    parse_pool.submit(int).result()
+
+    csv_writer = CsvGraphWriter(args.csv_dir) if args.csv_dir else None
+    handler = KnowledgeGraphHandler(config, connect=csv_writer is None, graph_writer=csv_writer)
+    if csv_writer is None:
+        # Endpoint lookups and chunk merges rely on the entity index and provenance constraints
+        handler.create_indexes()
+
+    checkpoint = Checkpoint(args.checkpoint)
+    base = source_base(args.source)
+    paths = (path for path in iter_input_paths(args.source) if path not in checkpoint.done)
+
+    totals = {"documents": 0, "failed": 0, "chunks": 0, "reused_chunks": 0, "nodes": 0, "relationships": 0}
+    totals_lock = threading.Lock()
+    started = time.perf_counter()
+
+    def finish(path, parsed_future):
+        try:
+            parsed = parsed_future.result()
+            counts = ingest_parsed(handler, parsed)
+        except Exception as e:
+            logger.error(f"Failed to ingest {path}: {e}")
+            checkpoint.record(path, "failed", error=str(e))
+            with totals_lock:
+                totals["failed"] += 1
+            return
+
+        checkpoint.record(path, "done", hash=parsed["hash"], chunks=counts["chunks"],
+                          failedChunks=len(counts["failed_chunks"]))
+        with totals_lock:
+            totals["documents"] += 1
+            for key in ("chunks", "reused_chunks", "nodes", "relationships"):
+                totals[key] += counts[key]
+            documents = totals["documents"]
+        elapsed = time.perf_counter() - started
+        logger.info(f"Ingested {path} ({documents} documents, {documents / elapsed * 3600:.0f} documents/hour)")
+
+    document_pool = ThreadPoolExecutor(max_workers=args.documents, thread_name_prefix="bulk-document")
+    try:
+        # Keep a bounded number of documents parsed ahead of extraction
+        in_flight = set()
+        for path in paths:
+            if len(in_flight) >= args.documents * 2:
+                finished, in_flight = wait(in_flight, return_when=FIRST_COMPLETED)
+            parsed_future = parse_pool.submit(parse_document, path, os.path.relpath(path, base))
+            in_flight.add(document_pool.submit(finish, path, parsed_future))
+        wait(in_flight)
+    finally:
+        document_pool.shutdown(wait=True)
+        parse_pool.shutdown(wait=True)
+        checkpoint.close()
+
+    logger.info(f"Bulk ingestion finished in {time.perf_counter() - started:.0f}s: {totals}")
+
+    if csv_writer is not None:
+        command = csv_writer.finish()
+        logger.info(f"Import with: {command}")
+        logger.info("Then run `python bulk_ingest.py --create-indexes` against the imported database.")
+    else:
+        from src.services.version_service import version_service
+
+        # Invalidate query caches of running API workers
+        try:
+            version_service.bump("graph")
+        except Exception as e:
+            logger.error(f"Unable to bump the graph version, restart the API to clear its caches: {e}")
+
+
+def create_indexes():
+    """Create the indexes and constraints the API relies on, e.g. after a neo4j-admin import."""
+    from src.handlers.knowledge_graph_handler import KnowledgeGraphHandler
+
+    KnowledgeGraphHandler(config).create_indexes()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("source", nargs="?", help="directory of PDFs or manifest file with one PDF path per line")
+    parser.add_argument("--checkpoint", default="bulk-ingest-checkpoint.jsonl", help="JSONL checkpoint file")
+    parser.add_argument("--csv-dir", help="write neo4j-admin import CSVs to this directory instead of Neo4j")
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1, help="parse/OCR processes")
+    parser.add_argument("--documents", type=int, default=4, help="documents extracted concurrently")
+    parser.add_argument("--llm-concurrency", type=int, default=config.extraction_concurrency * 2,
+                        help="concurrent LLM extraction calls across all documents")
+    parser.add_argument("--batch-size", type=int, default=2000, help="rows per graph write transaction")
+    parser.add_argument("--window", type=int, default=config.ingest_window_chunks * 2,
+                        help="chunks extracted and written per window")
+    parser.add_argument("--create-indexes", action="store_true", help="only create indexes and constraints")
+    args = parser.parse_args()
+
+    if args.create_indexes:
+        create_indexes()
+        return
+    if not args.source:
+        parser.error("source is required")
+    run(args)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,24 +1,260 @@
-from flask import Flask, request, jsonify
+from flask import Flask, Response, request, jsonify, stream_with_context
 
-from io import BytesIO
+import json
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from bson import ObjectId
 
 from src.handlers.glossary_handler import GlossaryHandler
 from src.handlers.knowledge_graph_handler import KnowledgeGraphHandler
 from src.generators.answer_generator import AnswerGenerator
 from src.services.storage_service import StorageService
+from src.services.job_service import JobFailed, JobService
+from src.services.version_service import version_service
+from src.services.glossary_import import iter_csv_items, iter_json_array_items, iter_ndjson_items
 
 from src.config.config import Config
 from src.config.logging_config import setup_logging
 
 config = Config()
 logger = setup_logging(config.logging_config)
-answer_generator = AnswerGenerator(config)
-storage_service = StorageService()
-glossary_handler = GlossaryHandler()
 
 app = Flask(__name__)
-# Initialize the KnowledgeGraphHandler
-handler = KnowledgeGraphHandler(config)
+
+# Services of this process, created by init_services() on the first request. Importing this module
+# opens no connections and starts no threads, so workers forked from a preloading parent (gunicorn
+# --preload) each create their own clients, pools and job runner.
+storage_service = None
+glossary_handler = None
+answer_generator = None
+handler = None
+upload_executor = None
+job_service = None
+_services_lock = threading.Lock()
+
+
+def init_services():
+    """Create the handlers, pools and job runner of this process once; safe to call from any thread."""
+    global storage_service, glossary_handler, answer_generator, handler, upload_executor, job_service
+    if job_service is not None:
+        return
+    with _services_lock:
+        if job_service is not None:
+            return
+
+        storage_service = StorageService()
+        glossary_handler = GlossaryHandler()
+        answer_generator = AnswerGenerator(config, glossary_handler=glossary_handler)
+
+        # Heavy models are loaded on first use unless warm-up is enabled
+        handler = KnowledgeGraphHandler(config)
+        if config.warm_up_on_start:
+            handler.warm_up()
+
+        # Blob uploads run next to the graph pipeline of their ingestion job
+        upload_executor = ThreadPoolExecutor(max_workers=config.ingestion_workers, thread_name_prefix="blob-upload")
+
+        # Background ingestion, deletion and reprocessing jobs
+        jobs = JobService()
+        jobs.register("ingest", run_ingestion_job)
+        jobs.register("delete", run_delete_job)
+        jobs.register("reprocess", run_reprocess_job)
+        job_service = jobs
+
+        # The first request does not wait for index creation or the job scan
+        threading.Thread(target=run_startup_tasks, name="startup-tasks", daemon=True).start()
+
+
+def run_startup_tasks():
+    """Create indexes (unless migrate.py does it on deploy) and resume jobs left by a previous process."""
+    steps = []
+    if config.migrate_on_start:
+        steps += [("Neo4j index creation", handler.create_indexes),
+                  ("Document index creation", storage_service.ensure_indexes)]
+    steps.append(("Resuming pending jobs", job_service.resume_pending_jobs))
+
+    # A failing step does not keep the others from running
+    for name, step in steps:
+        try:
+            step()
+        except Exception as e:
+            logger.error(f"{name} after startup failed: {e}")
+    job_service.start_sweeper()
+
+
+@app.before_request
+def ensure_services():
+    init_services()
+
+
+def run_ingestion_job(job, progress):
+    """
+    Store the PDF spooled with the job and build its knowledge graph, concurrently.
+
+    Outcomes when one side fails:
+    - graph built, storage failed: the document's graph is removed again, since without a metadata
+      record it could not be listed or deleted; extraction results stay cached for a retry.
+    - stored, graph failed: the document is kept with graph status "failed" and can be reprocessed.
+    - both failed: whatever windows reached the graph are removed, as nothing could reference them.
+    The job fails in both cases, with the outcome and the successful side recorded in its result.
+
+    With params["replaces"], the id of an earlier version's metadata record, that version's graph, file and
+    record are deleted once both sides succeeded, so a failed job leaves the earlier version in place.
+    """
+    params = job.get("params") or {}
+    document_id = params.get("documentId")
+    document_hash = params.get("documentHash")
+    previous = storage_service.get_document(params["replaces"]) if params.get("replaces") else None
+
+    upload_future = None
+    if params.get("upload"):
+        upload_future = upload_executor.submit(
+            storage_service.upload_pdf_and_metadata,
+            pdf_path=job["payloadPath"],
+            original_filename=params["filename"],
+            content_type=params.get("contentType"),
+            document_hash=document_hash,
+            file_size=params.get("fileSize"),
+            document_id=document_id,
+            extra_metadata={"graph": {"status": "processing", "jobId": job["_id"]}}
+        )
+    elif document_id:
+        storage_service.set_graph_status(document_id, "processing", jobId=job["_id"])
+
+    graph_result, graph_error = None, None
+    try:
+        # The spooled payload is parsed and OCRed from disk, never read into memory as a whole
+        graph_result = handler.process_document(
+            job["payloadPath"],
+            progress=progress,
+            filename=params.get("filename"),
+            document_id=document_id,
+            document_hash=document_hash
+        )
+    except Exception as e:
+        logger.error(f"Graph extraction for job {job['_id']} failed: {e}", exc_info=True)
+        graph_error = e
+
+    upload_result, upload_error = None, None
+    if upload_future is not None:
+        progress("storing")
+        try:
+            upload_result, status = upload_future.result()
+            if status == 409:
+                # Stored concurrently by another upload of the same content; link the graph to that record
+                document_id = upload_result["documentId"]
+                if graph_error is None:
+                    handler.graph_writer.save_document({"id": graph_result["document"], "documentId": document_id})
+        except Exception as e:
+            logger.error(f"Upload for job {job['_id']} failed: {e}", exc_info=True)
+            upload_error = e
+
+    if graph_error is None and upload_error is None:
+        replaced = None
+        if previous and str(previous["_id"]) != document_id and previous["hash"] != document_hash:
+            progress("replacing_previous_version")
+            storage_service.mark_document(previous, "deleting")
+            replaced = handler.delete_document(previous["hash"], progress=progress)
+            storage_service.delete_document(previous)
+        graph_changed()
+        if document_id:
+            storage_service.set_graph_status(
+                document_id, "succeeded", jobId=job["_id"],
+                **{key: graph_result[key] for key in ("chunks", "nodes", "relationships")}
+            )
+        return {"outcome": "completed", "documentId": document_id, "upload": upload_result, "graph": graph_result,
+                "replaced": replaced}
+
+    if graph_error is None:
+        removed = handler.delete_document(graph_result["document"])
+        graph_changed()
+        raise JobFailed(
+            f"Upload failed, the document's graph was rolled back: {upload_error}",
+            result={"outcome": "upload_failed", "graph": graph_result, "removed": removed}
+        )
+
+    if upload_error is None:
+        # Windows written before the failure are already in the graph
+        graph_changed()
+        if document_id:
+            storage_service.set_graph_status(document_id, "failed", jobId=job["_id"], error=str(graph_error))
+        raise JobFailed(
+            f"Graph extraction failed, the document is stored and can be reprocessed: {graph_error}",
+            result={"outcome": "graph_failed", "documentId": document_id, "upload": upload_result}
+        )
+    removed = handler.delete_document(document_hash)
+    graph_changed()
+    raise JobFailed(
+        f"Upload failed: {upload_error}; graph extraction failed, its partial graph was rolled back: {graph_error}",
+        result={"outcome": "failed", "removed": removed}
+    )
+
+
+def run_delete_job(job, progress):
+    """Remove a document from the knowledge graph, blob storage and the metadata collection."""
+    document = storage_service.get_document(job["params"]["documentId"])
+    if not document:
+        return {"deleted": False, "message": "Document not found."}
+
+    # Hide the document from listings while its graph is being removed
+    storage_service.mark_document(document, "deleting")
+    counts = handler.delete_document(document["hash"], progress=progress)
+    graph_changed()
+
+    progress("deleting_files")
+    storage_service.delete_document(document)
+    return {"deleted": True, "graph": counts}
+
+
+def run_reprocess_job(job, progress):
+    """Rebuild the knowledge graph of a stored document from its PDF."""
+    document = storage_service.get_document(job["params"]["documentId"])
+    if not document:
+        raise ValueError("Document not found.")
+
+    document_id = str(document["_id"])
+    storage_service.set_graph_status(document_id, "processing", jobId=job["_id"])
+
+    try:
+        progress("downloading")
+        pdf_path = storage_service.download_pdf(document)
+        try:
+            # Remove the document's current subgraph first so its chunks are extracted again
+            removed = handler.delete_document(document["hash"], progress=progress)
+            result = handler.process_document(
+                pdf_path,
+                progress=progress,
+                filename=document["filename"],
+                document_id=document_id,
+                document_hash=document["hash"]
+            )
+        finally:
+            os.remove(pdf_path)
+    except Exception as e:
+        # The previous graph may already be gone; the document can be reprocessed again
+        graph_changed()
+        storage_service.set_graph_status(document_id, "failed", jobId=job["_id"], error=str(e))
+        raise
+
+    result["removed"] = removed
+    graph_changed()
+    storage_service.set_graph_status(
+        document_id, "succeeded", jobId=job["_id"],
+        **{key: result[key] for key in ("chunks", "nodes", "relationships")}
+    )
+    return result
+
+
+def graph_changed():
+    # Invalidate cached entities, context and answers built from the previous graph
+    version_service.bump("graph")
+
+    # Make new entities available to query entity extraction and drop deleted ones; the gazetteer
+    # is rebuilt in the background, the job does not wait for it
+    answer_generator.query_handler.schedule_gazetteer_refresh()
+
 
 @app.route('/api/knowledge-graph/process-document', methods=['POST'])
 def process_document():
@@ -30,47 +266,138 @@ def process_document():
         logger.info({"error": "No selected file"})
         return jsonify({"message": "No selected file"}), 400
 
+    upload_path = None
     try:
-        pdf_bytes = file.read()
-        file_stream = BytesIO(pdf_bytes)
-
-        # First, try uploading the file
-        result, status = storage_service.upload_pdf_and_metadata(
-            pdf_bytes=pdf_bytes,
-            original_filename=file.filename,
-            content_type=file.content_type
-        )
+        # Spool the body to disk and hash it while streaming instead of reading it into memory
+        upload_path, document_hash, file_size = storage_service.spool_upload(file.stream)
 
-        if status == 409:
+        # Same content already stored: return its existing graph job instead of extracting again
+        existing = storage_service.find_by_hash(document_hash)
+        graph = (existing or {}).get("graph") or {}
+        if existing and graph.get("status") != "failed":
             logger.info({"message": "File already exists."})
+            response = {"message": "Document already exists.", "documentId": str(existing["_id"]), "graph": graph}
+            if graph.get("jobId"):
+                response["jobId"] = graph["jobId"]
+                response["statusUrl"] = f"/api/knowledge-graph/jobs/{graph['jobId']}"
+            return jsonify(response), 200
+
+        if existing:
+            # Stored earlier but its graph failed: build the graph only
+            params = {"filename": file.filename, "documentId": str(existing["_id"]),
+                      "documentHash": document_hash, "upload": False}
         else:
-            logger.info({"message": "File uploaded successfully."})
+            # Upload and graph extraction run concurrently in the job; the record id is fixed up front
+            params = {"filename": file.filename, "documentId": str(ObjectId()), "documentHash": document_hash,
+                      "contentType": file.content_type, "fileSize": file_size, "upload": True}
 
-        # Process knowledge graph regardless of upload status
-        handler.process_document(pdf_bytes)
+            # A new version of a stored document names the document it replaces explicitly
+            replaces = request.form.get('replaces')
+            if replaces:
+                if not storage_service.get_document(replaces):
+                    return jsonify({"error": "Document to replace not found"}), 404
+                params["replaces"] = replaces
 
-        logger.info({"message": "Knowledge graph created successfully."})
+        job_id = job_service.submit("ingest", payload_file=upload_path, params=params)
+        # The spooled file now belongs to the job
+        upload_path = None
 
-        # Return appropriate message
-        if status == 409:
-            return jsonify({"message": "Document already exists."}), 200
-        else:
-            return jsonify(result), status
+        logger.info({"message": "Knowledge graph job submitted.", "jobId": job_id})
+        return jsonify({
+            "jobId": job_id,
+            "statusUrl": f"/api/knowledge-graph/jobs/{job_id}",
+            "documentId": params["documentId"]
+        }), 202
 
     except Exception as e:
         logger.error(f"Error while creating the knowledge graph: {e}")
         return jsonify({"error": f"Error while creating the knowledge graph: {str(e)}"}), 500
 
+    finally:
+        if upload_path and os.path.exists(upload_path):
+            os.remove(upload_path)
+
+
+@app.route('/api/knowledge-graph/jobs/<job_id>', methods=['GET'])
+def get_job_status(job_id):
+    try:
+        job = job_service.get_job(job_id)
+        if not job:
+            return jsonify({"error": "Job not found"}), 404
+        return jsonify(job), 200
+    except Exception as e:
+        logger.error({"error": str(e)})
+        return jsonify({"message": str(e)}), 500
+
+
+@app.route('/api/knowledge-graph/extraction-cache', methods=['GET'])
+def get_extraction_cache_stats():
+    if handler.extraction_cache is None:
+        return jsonify({"message": "Extraction cache is disabled"}), 404
+    return jsonify(handler.extraction_cache.stats()), 200
+
+
+@app.route('/api/knowledge-graph/query-cache', methods=['GET'])
+def get_query_cache_stats():
+    if answer_generator.cache is None:
+        return jsonify({"message": "Query cache is disabled"}), 404
+    return jsonify(answer_generator.cache.stats()), 200
+
 
+# Documents newest first, one page per request: ?limit=50&cursor=<nextCursor>&filename=<prefix>&fileType=<type>
 @app.route('/api/documents', methods=['GET'])
 def get_all_documents():
     try:
-        result, status = storage_service.list_documents()
-        return jsonify(result), status
+        page = storage_service.list_documents(
+            limit=request.args.get('limit'),
+            cursor=request.args.get('cursor'),
+            filename=request.args.get('filename'),
+            file_type=request.args.get('fileType')
+        )
+        documents = iter(page)
+        first = next(documents, None)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
     except Exception as e:
         logger.error({"error": str(e)})
         return jsonify({"message": str(e)}), 500
 
+    if first is None and not request.args.get('cursor'):
+        return jsonify({"error": "No documents found"}), 404
+
+    def body():
+        # Documents are serialized one at a time as they are read from the MongoDB cursor
+        yield '{"documents": ['
+        if first is not None:
+            yield json.dumps(first)
+            for doc in documents:
+                yield "," + json.dumps(doc)
+        yield '], "nextCursor": ' + json.dumps(page.next_cursor) + '}'
+
+    return Response(stream_with_context(body()), mimetype="application/json")
+
+@app.route('/api/documents/<document_id>', methods=['DELETE'])
+def delete_document(document_id):
+    document = storage_service.get_document(document_id)
+    if not document:
+        return jsonify({"error": "Document not found"}), 404
+
+    job_id = job_service.submit("delete", params={"documentId": document_id})
+    logger.info({"message": "Document deletion job submitted.", "jobId": job_id})
+    return jsonify({"jobId": job_id, "statusUrl": f"/api/knowledge-graph/jobs/{job_id}"}), 202
+
+
+@app.route('/api/documents/<document_id>/reprocess', methods=['POST'])
+def reprocess_document(document_id):
+    document = storage_service.get_document(document_id)
+    if not document:
+        return jsonify({"error": "Document not found"}), 404
+
+    job_id = job_service.submit("reprocess", params={"documentId": document_id})
+    logger.info({"message": "Document reprocessing job submitted.", "jobId": job_id})
+    return jsonify({"jobId": job_id, "statusUrl": f"/api/knowledge-graph/jobs/{job_id}"}), 202
+
+
 @app.route('/api/knowledge-graph/query', methods=['POST'])
 def get_answer():
     data = request.get_json()
@@ -88,6 +415,60 @@ def get_answer():
 
 
 
+def format_sse(event, data):
+    """Format one server-sent event."""
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+
+@app.route('/api/knowledge-graph/query/stream', methods=['POST'])
+def stream_answer():
+    data = request.get_json()
+
+    if not data or 'question' not in data:
+        return jsonify({"error": "Question field is required"}), 400
+
+    question = data['question']
+
+    def events():
+        # Flush the response headers right away, before retrieval starts
+        yield ": stream opened\n\n"
+        try:
+            for event, payload in answer_generator.stream_answer(question):
+                yield format_sse(event, payload)
+        except Exception as e:
+            yield format_sse("error", {"error": str(e)})
+
+    return Response(
+        stream_with_context(events()),
+        mimetype="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+
+# Answer many questions in one request; results are streamed as NDJSON, one line per question as it finishes
+@app.route('/api/knowledge-graph/query/batch', methods=['POST'])
+def batch_answer():
+    data = request.get_json()
+
+    questions = data.get('questions') if isinstance(data, dict) else None
+    if not isinstance(questions, list) or not questions:
+        return jsonify({"error": "Questions field must be a non-empty list"}), 400
+    if not all(isinstance(question, str) and question.strip() for question in questions):
+        return jsonify({"error": "Every question must be a non-empty string"}), 400
+    if len(questions) > config.batch_max_questions:
+        return jsonify({"error": f"At most {config.batch_max_questions} questions per batch"}), 400
+
+    def lines():
+        try:
+            for index, result in answer_generator.answer_batch(questions):
+                yield json.dumps({"index": index, "question": questions[index], **result}) + "\n"
+        except Exception as e:
+            logger.error(f"Error answering batch: {e}")
+            yield json.dumps({"error": str(e)}) + "\n"
+
+    return Response(stream_with_context(lines()), mimetype="application/x-ndjson")
+
+
 # New endpoint: add glossary items
 @app.route('/api/glossary/add', methods=['POST'])
 def add_glossary():
@@ -102,6 +483,30 @@ def add_glossary():
         return jsonify({"error": str(e)}), 500
 
 
+# Bulk import of large glossary files, streamed as CSV, NDJSON or a JSON array
+@app.route('/api/glossary/import', methods=['POST'])
+def import_glossary():
+    content_type = (request.mimetype or "").lower()
+    if content_type in ("text/csv", "application/csv"):
+        items = iter_csv_items(request.stream)
+    elif content_type in ("application/x-ndjson", "application/jsonl"):
+        items = iter_ndjson_items(request.stream)
+    elif content_type == "application/json":
+        items = iter_json_array_items(request.stream)
+    else:
+        return jsonify({"error": "Expected a text/csv, application/x-ndjson or application/json body."}), 415
+
+    try:
+        result = glossary_handler.import_glossary_items(items)
+        return jsonify(result), 200
+    except ValueError as e:
+        logger.error(f"Invalid glossary import body: {e}")
+        return jsonify({"error": str(e)}), 400
+    except Exception as e:
+        logger.error(f"Error importing glossary items: {e}")
+        return jsonify({"error": str(e)}), 500
+
+
 # New endpoint: get all glossary items
 @app.route('/api/glossary/list', methods=['GET'])
 def list_glossary():
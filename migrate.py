@@ -0,0 +1,30 @@
+"""
+Create the Neo4j and MongoDB indexes and constraints the API relies on
+
+Index creation is idempotent. Run this once per deploy; set MIGRATE_ON_START=false
+so API workers skip the Neo4j and document indexes after startup. The glossary
+term key back-fill and deduplication only ever run here:
+
+    python migrate.py
+"""
+from src.config.config import Config
+from src.config.logging_config import setup_logging
+
+config = Config()
+logger = setup_logging(config.logging_config)
+
+
+def main():
+    from src.handlers.glossary_handler import GlossaryHandler
+    from src.handlers.knowledge_graph_handler import KnowledgeGraphHandler
+    from src.services.storage_service import StorageService
+
+    KnowledgeGraphHandler(config).create_indexes()
+    StorageService().ensure_indexes()
+    # Only here: the term key back-fill must not run in several workers at once
+    GlossaryHandler().migrate_term_keys()
+    logger.info("Migrations finished")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,4 +1,6 @@
+import multiprocessing
 import os
+import tempfile
 from dotenv import load_dotenv
 
 load_dotenv()
@@ -24,6 +26,9 @@ class Config:
         self.neo4j_uri = os.getenv("NEO4J_URI", "neo4j+s://c95a3680.databases.neo4j.io")
         self.neo4j_username = os.getenv("NEO4J_USERNAME", "neo4j")
         self.neo4j_password = os.getenv("NEO4J_PASSWORD", "5SYecqiUcLZz4pzO9CDdGs9jlU5rOKUQ6ddtK6DEl1o")
+        self.neo4j_max_pool_size = int(os.getenv("NEO4J_MAX_POOL_SIZE", "50"))
+        self.neo4j_connection_timeout = float(os.getenv("NEO4J_CONNECTION_TIMEOUT_SECONDS", "30"))
+        self.neo4j_acquisition_timeout = float(os.getenv("NEO4J_ACQUISITION_TIMEOUT_SECONDS", "60"))
         
         self.deepinfra_api_token = os.getenv("DEEPINFRA_API_TOKEN", "YuGM4YMWqQU4kVM0u47Ntev9gUjFv2Om")
 
@@ -61,19 +66,116 @@ class Config:
         self.groq_model = os.getenv("GROQ_MODEL", "llama-3.1-8b-instant")
         # self.groq_temperature = os.getenv("GROQ_TEMPERATURE", "0")
 
+        # Load the graph transformer and OCR workers at startup instead of on first use
+        self.warm_up_on_start = os.getenv("WARM_UP_ON_START", "false").lower() == "true"
+        # Create database indexes in the background after startup; disable when migrate.py runs on deploy
+        self.migrate_on_start = os.getenv("MIGRATE_ON_START", "true").lower() == "true"
+
+        # Graph extraction configuration
+        self.extraction_concurrency = int(os.getenv("EXTRACTION_CONCURRENCY", "4"))
+        self.extraction_max_retries = int(os.getenv("EXTRACTION_MAX_RETRIES", "2"))
+        self.extraction_retry_backoff = float(os.getenv("EXTRACTION_RETRY_BACKOFF_SECONDS", "1.0"))
+        # Bump when the extraction prompt or transformer settings change to invalidate cached results
+        self.extraction_prompt_version = os.getenv("EXTRACTION_PROMPT_VERSION", "1")
+        self.extraction_cache_enabled = os.getenv("EXTRACTION_CACHE_ENABLED", "true").lower() == "true"
+        self.extraction_cache_path = os.getenv(
+            "EXTRACTION_CACHE_PATH", os.path.join(os.getcwd(), ".cache", "extraction-cache.sqlite3")
+        )
+        self.extraction_cache_max_bytes = int(os.getenv("EXTRACTION_CACHE_MAX_MB", "512")) * 1024 * 1024
+
+        # OCR configuration
+        self.ocr_workers = int(os.getenv("OCR_WORKERS", str(os.cpu_count() or 1)))
+        self.ocr_pages_per_task = int(os.getenv("OCR_PAGES_PER_TASK", "4"))
+        # Pages whose stripped text layer is shorter than this are OCRed
+        self.ocr_min_text_chars = int(os.getenv("OCR_MIN_TEXT_CHARS", "10"))
+        # Worker processes are not forked from the threaded server process, which can deadlock them
+        self.ocr_start_method = os.getenv(
+            "OCR_START_METHOD", "forkserver" if "forkserver" in multiprocessing.get_all_start_methods() else "spawn"
+        )
+        self.ocr_dpi = int(os.getenv("OCR_DPI", "72"))
+        # Pages rendered and passed to the OCR engine together
+        self.ocr_batch_size = int(os.getenv("OCR_BATCH_SIZE", "4"))
+
+        # Number of chunks extracted and written to the graph together while streaming a document
+        self.ingest_window_chunks = int(os.getenv("INGEST_WINDOW_CHUNKS", "32"))
+
+        # Local entity gazetteer used before the LLM for query entity extraction
+        self.gazetteer_enabled = os.getenv("GAZETTEER_ENABLED", "true").lower() == "true"
+        self.gazetteer_min_length = int(os.getenv("GAZETTEER_MIN_LENGTH", "3"))
+        self.gazetteer_refresh_seconds = int(os.getenv("GAZETTEER_REFRESH_SECONDS", "300"))
+
+        # Graph retrieval: "simple" (top 2 matches, 1 hop, 50 triples per entity) or
+        # "ranked" (multi-hop candidates scored and packed into a token budget)
+        self.retrieval_mode = os.getenv("RETRIEVAL_MODE", "simple").lower()
+        self.retrieval_max_hops = int(os.getenv("RETRIEVAL_MAX_HOPS", "2"))
+        self.retrieval_token_budget = int(os.getenv("RETRIEVAL_TOKEN_BUDGET", "1500"))
+        self.retrieval_fulltext_limit = int(os.getenv("RETRIEVAL_FULLTEXT_LIMIT", "3"))
+        self.retrieval_path_limit = int(os.getenv("RETRIEVAL_PATH_LIMIT", "500"))
+        self.retrieval_candidate_limit = int(os.getenv("RETRIEVAL_CANDIDATE_LIMIT", "300"))
+        self.retrieval_hop_decay = float(os.getenv("RETRIEVAL_HOP_DECAY", "0.5"))
+
+        # Pre-LLM query stages (graph retrieval, glossary lookup) run concurrently, each in its own pool,
+        # with these timeouts
+        self.query_stage_workers = int(os.getenv("QUERY_STAGE_WORKERS", "16"))
+        self.glossary_stage_workers = int(os.getenv("GLOSSARY_STAGE_WORKERS", "4"))
+        self.retrieval_timeout_seconds = float(os.getenv("RETRIEVAL_TIMEOUT_SECONDS", "20"))
+        self.glossary_timeout_seconds = float(os.getenv("GLOSSARY_TIMEOUT_SECONDS", "2"))
+
+        # Batch question endpoint
+        self.batch_max_questions = int(os.getenv("BATCH_MAX_QUESTIONS", "500"))
+        self.batch_answer_concurrency = int(os.getenv("BATCH_ANSWER_CONCURRENCY", "4"))
+        self.entity_batch_size = int(os.getenv("ENTITY_BATCH_SIZE", "20"))
+
+        # Question answering cache
+        self.query_cache_enabled = os.getenv("QUERY_CACHE_ENABLED", "true").lower() == "true"
+        self.query_cache_max_entries = int(os.getenv("QUERY_CACHE_MAX_ENTRIES", "1000"))
+        self.query_cache_ttl_seconds = int(os.getenv("QUERY_CACHE_TTL_SECONDS", "3600"))
+        # How long a worker trusts its local copy of the graph/glossary versions
+        self.version_check_seconds = float(os.getenv("VERSION_CHECK_SECONDS", "5"))
+
+        # Neo4j write configuration
+        self.graph_write_batch_size = int(os.getenv("GRAPH_WRITE_BATCH_SIZE", "500"))
+        self.graph_delete_batch_size = int(os.getenv("GRAPH_DELETE_BATCH_SIZE", "100"))
+
 
         # MongoDB
         self.mongo_uri = os.getenv("MONGO_URI", "mongodb://localhost:27017")
+        self.mongo_max_pool_size = int(os.getenv("MONGO_MAX_POOL_SIZE", "50"))
+        self.mongo_timeout_ms = int(os.getenv("MONGO_TIMEOUT_MS", "10000"))
         self.mongo_glossary_db = os.getenv("GlossaryDB", "GlossaryDB")
         self.mongo_glossary_collection = os.getenv("GlossaryCollection", "glossary-collection")
+        self.glossary_refresh_seconds = int(os.getenv("GLOSSARY_REFRESH_SECONDS", "300"))
+        self.glossary_import_batch_size = int(os.getenv("GLOSSARY_IMPORT_BATCH_SIZE", "1000"))
 
         self.mongo_metadata_db = os.getenv("METADATA_DB", "Metadata")
         self.mongo_metadata_collection = os.getenv("METADATA_COLLECTION", "metadata-collection")
+        self.mongo_versions_collection = os.getenv("VERSIONS_COLLECTION", "versions")
+
+        self.mongo_jobs_db = os.getenv("JOBS_DB", "Jobs")
+        self.mongo_jobs_collection = os.getenv("JOBS_COLLECTION", "ingestion-jobs")
+
+        # Background ingestion jobs
+        self.ingestion_workers = int(os.getenv("INGESTION_WORKERS", "2"))
+        self.job_spool_dir = os.getenv("JOB_SPOOL_DIR", os.path.join(tempfile.gettempdir(), "kg-jobs"))
+        self.job_stale_seconds = int(os.getenv("JOB_STALE_SECONDS", "900"))
+        # Interval of the sweep that renews heartbeats and resumes jobs of dead workers
+        self.job_sweep_seconds = int(os.getenv("JOB_SWEEP_SECONDS", "60"))
 
 
         # Azure
         self.azure_connection_string = os.getenv("AZURE_CONNECTION_STRING", "DefaultEndpointsProtocol=https;AccountName=researchpdfstore;AccountKey=SQnY5MvTblA+bEu7bPw3orgeZhZzvg6jNTSF4c7yWCFsdk3cwWe5pqAPgPRGdCiwr2EIY/oKK8gR+AStFcG4WQ==;EndpointSuffix=core.windows.net")
         self.azure_container_name = os.getenv("CONTAINER_NAME", "blobpdfcontainer")
+        self.azure_connection_timeout = int(os.getenv("AZURE_CONNECTION_TIMEOUT_SECONDS", "20"))
+        self.azure_read_timeout = int(os.getenv("AZURE_READ_TIMEOUT_SECONDS", "60"))
+        # Uploads larger than the single put size are sent as staged blocks, several at a time
+        self.azure_max_block_size = int(os.getenv("AZURE_MAX_BLOCK_SIZE", str(4 * 1024 * 1024)))
+        self.azure_max_single_put_size = int(os.getenv("AZURE_MAX_SINGLE_PUT_SIZE", str(8 * 1024 * 1024)))
+        self.azure_upload_concurrency = int(os.getenv("AZURE_UPLOAD_CONCURRENCY", "4"))
+        # Read size used when spooling request bodies to disk
+        self.upload_read_size = int(os.getenv("UPLOAD_READ_SIZE", str(1024 * 1024)))
+        # Document listing page sizes
+        self.documents_page_size = int(os.getenv("DOCUMENTS_PAGE_SIZE", "50"))
+        self.documents_max_page_size = int(os.getenv("DOCUMENTS_MAX_PAGE_SIZE", "500"))
 
 
     
\ No newline at end of file
@@ -1,46 +1,35 @@
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from concurrent.futures import TimeoutError as FutureTimeoutError
+
 from langchain_core.prompts import ChatPromptTemplate
-from langchain_core.output_parsers import StrOutputParser
-from langchain_community.llms import DeepInfra
-from neo4j import GraphDatabase
-from langchain_community.graphs import Neo4jGraph
-from neo4j import GraphDatabase
 from langchain_groq import ChatGroq
 from langchain_core.messages import AIMessage
 
 from src.handlers.glossary_handler import GlossaryHandler
 from src.handlers.query_handler import QueryHandler
+from src.services.query_cache import QueryCache
 from src.config.config import Config
 from src.config.logging_config import setup_logging
 
 config = Config()
 logger = setup_logging(config.logging_config)
-glossary_handler = GlossaryHandler()
-query_hander = QueryHandler(config)
 
 class AnswerGenerator:
-    def __init__(self, config):
-        # Initialize Neo4j driver with credentials from Config
+    def __init__(self, config, glossary_handler=None, query_handler=None, cache=None):
         self.config = config
-        self.neo4j_uri = config.neo4j_uri
-        self.neo4j_username = config.neo4j_username
-        self.neo4j_password = config.neo4j_password
-        
-        try:
-            self.driver = GraphDatabase.driver(
-            self.neo4j_uri,
-            auth=(self.neo4j_username, self.neo4j_password))
-            
-            graph = Neo4jGraph(
-                url=self.neo4j_uri,
-                username=self.neo4j_username,
-                password=self.neo4j_password
-            )
-            
-            logger.info("Successfully connected to neo4j services")
-        
-        except Exception as e:
-            logger.error("Error connecting to neo4j services")
-            raise ConnectionError(f"Unable to connect tp neo4j: {e}")
+
+        # Entity, context and answer cache, invalidated by the graph and glossary versions
+        self.cache = cache
+        if self.cache is None and config.query_cache_enabled:
+            self.cache = QueryCache()
+
+        # Share the handlers of the caller when given, so connections and caches are not duplicated
+        self.glossary_handler = glossary_handler or GlossaryHandler()
+        self.query_handler = query_handler or QueryHandler(config, cache=self.cache)
+        if self.cache is not None:
+            # Answers depend on the glossary the matcher holds, which can lag behind the stored one
+            self.cache.register_version("glossary", self.glossary_handler.current_version)
 
         # Load the DeepInfra API token for the LLM
         self.deepinfra_api_token = config.deepinfra_api_token
@@ -57,6 +46,17 @@ class AnswerGenerator:
             max_tokens=None
         )
         
+        # Pools running the independent pre-LLM stages of each query concurrently; one per stage, so slow
+        # retrievals queued up under load do not eat into the glossary deadline
+        self.retrieval_executor = ThreadPoolExecutor(
+            max_workers=config.query_stage_workers,
+            thread_name_prefix="query-retrieval"
+        )
+        self.glossary_executor = ThreadPoolExecutor(
+            max_workers=config.glossary_stage_workers,
+            thread_name_prefix="query-glossary"
+        )
+
         self.prompt = ChatPromptTemplate.from_template(self.chat_template)
         self.chain = self.prompt | self.llm_groq
         
@@ -64,43 +64,220 @@ class AnswerGenerator:
 
     def generate_answer(self, query):
         """Generate an answer based on the query using context from knowledge graph and glossary."""
+        if self.cache is not None:
+            key = self.cache.key("answer", query)
+            found, answer = self.cache.get("answer", query, key=key)
+            if found:
+                return answer
+
+        start = time.perf_counter()
+        answer, inputs = self._generate_answer(query)
+
+        # Answers built without one of the stages are not cached
+        if self.cache is not None and not inputs["degraded"]:
+            self.cache.put("answer", query, answer, time.perf_counter() - start, key=key)
+        return answer
+
+    def prepare_inputs(self, query):
+        """
+        Retrieve the knowledge graph context and glossary for the query concurrently.
+        A stage that fails or exceeds its timeout contributes nothing and is listed under "degraded".
+        """
+        started = time.monotonic()
+        # context retrieved from knowledge graph
+        retrieval_future = self.retrieval_executor.submit(self.query_handler.retrieve, query)
+        # glossary = self.glossary_provider(query).strip()
+        glossary_future = self.glossary_executor.submit(self.glossary_handler.match_glossary, query)
+
+        degraded = []
+        retrieval = self._stage_result(
+            "retrieval", retrieval_future, started + self.config.retrieval_timeout_seconds,
+            {"entities": [], "context": ""}, degraded
+        )
+        glossary_items = self._stage_result(
+            "glossary", glossary_future, started + self.config.glossary_timeout_seconds, [], degraded
+        )
+
+        logger.info(f"Query: {query} (Type: {type(query)})")
+        return self._build_inputs(retrieval, glossary_items, degraded)
+
+    @staticmethod
+    def _build_inputs(retrieval, glossary_items, degraded):
+        """degraded lists the stages that failed; a retrieval without entities adds its own "entities" flag."""
+        context = retrieval["context"]
+        logger.info(f"Retrieved context: {context}")
+
+        glossary = "\n".join(f"{term}: {definition}" for term, definition in glossary_items)
+        logger.info(f"Matched glossary for the query from glossary dictionary: {glossary}")
+
+        return {
+            "entities": retrieval["entities"],
+            "context": context,
+            "glossary": glossary,
+            "glossary_terms": [term for term, _ in glossary_items],
+            "context_stats": retrieval.get("stats"),
+            "documents": retrieval.get("documents", []),
+            "degraded": degraded + [stage for stage in retrieval.get("degraded", []) if stage not in degraded],
+        }
+
+    @staticmethod
+    def _stage_result(stage, future, deadline, default, degraded):
+        """Wait for a pre-LLM stage until its deadline, falling back to an empty contribution."""
         try:
-            # context retrieved from knowledge graph
-            context = query_hander.retrieve_context_from_kg(query)
-            logger.info(f"Retrieved context: {context}")
-
-            logger.info(f"Query: {query} (Type: {type(query)})")
-            logger.info(f"Context: (Type: {type(query)})")
-            
-            """
-            Dynamically determine if glossary should be included
-            """
-
-            logger.info("-----------Glossary Starts here---------------")
-            
-            # glossary = self.glossary_provider(query).strip()
-            glossary = glossary_handler.get_glossary_for_query(query)
-            logger.info(f"Matched glossary for the query from glossary dictionary: {glossary}")
-
-            logger.info(f"Context: {context}")
-
-            # Ensuring glossary field is always present to avoid errors
-            result = self.chain.invoke(
+            return future.result(timeout=max(deadline - time.monotonic(), 0))
+        except FutureTimeoutError:
+            future.cancel()
+            logger.error(f"Query stage '{stage}' timed out, continuing without it")
+        except Exception as e:
+            logger.error(f"Query stage '{stage}' failed, continuing without it: {e}")
+        degraded.append(stage)
+        return default
+
+    def _generate_answer(self, query):
+        try:
+            inputs = self.prepare_inputs(query)
+            return self._invoke_chain(query, inputs), inputs
+
+        except Exception as e:
+            logger.error(f"Error generating answer: {e}")
+            raise
+
+    def _invoke_chain(self, query, inputs):
+        logger.info(f"Context: {inputs['context']}")
+
+        # Ensuring glossary field is always present to avoid errors
+        result = self.chain.invoke(
+            {
+                "context": inputs["context"],
+                "glossary": inputs["glossary"] if inputs["glossary"] else "",  # Ensures no missing field
+                "question": query,
+            }
+        )
+
+        # Ensure the result is a string before returning it
+        if isinstance(result, AIMessage):
+            result = result.content  # Extracting the text content
+
+        logger.info(f"Answer generated form LLM: {result}")
+        return result
+
+    def answer_batch(self, questions):
+        """
+        Answer many questions, yielding (index, result) pairs as the answers finish.
+
+        Questions that normalize to the same text are answered once. Entity extraction
+        and graph retrieval run once for the whole batch (see QueryHandler.retrieve_batch),
+        then answers are generated with at most BATCH_ANSWER_CONCURRENCY LLM calls at a time.
+        """
+        groups = {}
+        for index, question in enumerate(questions):
+            groups.setdefault(QueryCache.normalize_question(question), []).append(index)
+
+        pending = []
+        keys = {}
+        for indices in groups.values():
+            question = questions[indices[0]]
+            if self.cache is not None:
+                keys[question] = self.cache.key("answer", question)
+                found, answer = self.cache.get("answer", question, key=keys[question])
+                if found:
+                    for index in indices:
+                        yield index, {"answer": answer, "cached": True}
+                    continue
+            pending.append((question, indices))
+        if not pending:
+            return
+
+        retrieval_degraded = []
+        try:
+            retrievals = self.query_handler.retrieve_batch([question for question, _ in pending])
+        except Exception as e:
+            logger.error(f"Batch retrieval failed, answering without graph context: {e}")
+            retrievals = {}
+            retrieval_degraded.append("retrieval")
+
+        def answer(question):
+            start = time.perf_counter()
+            degraded = list(retrieval_degraded)
+            try:
+                glossary_items = self.glossary_handler.match_glossary(question)
+            except Exception as e:
+                logger.error(f"Glossary lookup failed, continuing without it: {e}")
+                glossary_items = []
+                degraded.append("glossary")
+
+            retrieval = retrievals.get(question, {"entities": [], "context": ""})
+            inputs = self._build_inputs(retrieval, glossary_items, degraded)
+            result = self._invoke_chain(question, inputs)
+            if self.cache is not None and not inputs["degraded"]:
+                self.cache.put("answer", question, result, time.perf_counter() - start, key=keys[question])
+            return {"answer": result, "cached": False, "entities": inputs["entities"],
+                    "documents": inputs["documents"], "degraded": inputs["degraded"]}
+
+        executor = ThreadPoolExecutor(
+            max_workers=self.config.batch_answer_concurrency,
+            thread_name_prefix="batch-answer"
+        )
+        try:
+            futures = {executor.submit(answer, question): indices for question, indices in pending}
+            for future in as_completed(futures):
+                try:
+                    result = future.result()
+                except Exception as e:
+                    logger.error(f"Error generating answer: {e}")
+                    result = {"error": str(e)}
+                for index in futures[future]:
+                    yield index, result
+        finally:
+            # Stop queued questions when the client goes away
+            executor.shutdown(wait=False, cancel_futures=True)
+
+    def stream_answer(self, query):
+        """
+        Generate an answer as a stream of (event, data) pairs: a "metadata" event as soon as retrieval
+        finishes, then "token" events as the LLM produces them, then "done".
+        """
+        if self.cache is not None:
+            key = self.cache.key("answer", query)
+            found, answer = self.cache.get("answer", query, key=key)
+            if found:
+                yield "metadata", {"cached": True}
+                yield "token", {"token": answer}
+                yield "done", {"cached": True}
+                return
+
+        start = time.perf_counter()
+        try:
+            inputs = self.prepare_inputs(query)
+            yield "metadata", {
+                "cached": False,
+                "entities": inputs["entities"],
+                "contextSize": len(inputs["context"]),
+                "contextStats": inputs["context_stats"],
+                "documents": inputs["documents"],
+                "glossaryMatches": inputs["glossary_terms"],
+                "degraded": inputs["degraded"],
+            }
+
+            parts = []
+            for chunk in self.chain.stream(
                 {
-                    "context": context,
-                    "glossary": glossary if glossary else "",  # Ensures no missing field
+                    "context": inputs["context"],
+                    "glossary": inputs["glossary"] if inputs["glossary"] else "",
                     "question": query,
                 }
-            )
-            
-            # Ensure the result is a string before returning it
-            if isinstance(result, AIMessage):  
-                result = result.content  # Extracting the text content
-            
-            logger.info(f"Answer generated form LLM: {result}")
-            return result
-        
+            ):
+                token = getattr(chunk, "content", chunk)
+                if token:
+                    parts.append(token)
+                    yield "token", {"token": token}
+
         except Exception as e:
-            logger.error(f"Error generating answer: {e}")
+            logger.error(f"Error streaming answer: {e}")
             raise
-        
+
+        result = "".join(parts)
+        logger.info(f"Answer streamed from LLM: {result}")
+        if self.cache is not None and not inputs["degraded"]:
+            self.cache.put("answer", query, result, time.perf_counter() - start, key=key)
+        yield "done", {"cached": False}
@@ -1,9 +1,14 @@
-from src.services.mongo_service import MongoDBHandler
+import threading
+import time
 from datetime import datetime
-from pymongo.mongo_client import MongoClient
+
+from pymongo import UpdateOne
 
 from src.config.config import Config
 from src.config.logging_config import setup_logging
+from src.services.connection_registry import registry
+from src.services.term_matcher import TermMatcher
+from src.services.version_service import version_service
 
 config = Config()
 logger = setup_logging(config.logging_config)
@@ -11,39 +16,188 @@ logger = setup_logging(config.logging_config)
 class GlossaryHandler:
     def __init__(self):
         # Mongo config
-        self.mongo_client = MongoClient(config.mongo_uri)
+        self.mongo_client = registry.mongo_client
         self.glossary_db = self.mongo_client[config.mongo_glossary_db]
         self.glossary_collection = self.glossary_db[config.mongo_glossary_collection]
 
+        # In-memory matcher over the glossary terms, loaded on first use and refreshed
+        # periodically to pick up changes made by other workers
+        self.matcher = None
+        self.definitions = {}
+        self.loaded_at = 0.0
+        self.refresh_lock = threading.Lock()
+        self.refreshing = False
+        # Glossary versions whose writes the matcher terms hold (applied) and its automaton matches (built);
+        # swap_lock keeps them consistent with the matcher they describe
+        self.applied_version = None
+        self.matcher_version = None
+        self.swap_lock = threading.Lock()
+
+    def migrate_term_keys(self):
+        """
+        Back-fill the normalized term key on older documents, delete their duplicates and create the
+        unique index on the key. Run once by migrate.py, never by the API workers: concurrent runs could
+        key two duplicates alike before the index exists. The surviving document of a term is the one
+        refresh() and the listing already use (see _resolve_duplicates). Returns the counts.
+        """
+        keep = self._resolve_duplicates(self.glossary_collection.find({}, {"term": 1, "termKey": 1}))
+        backfilled = deleted = 0
+        duplicates = []
+        for doc in self.glossary_collection.find({}, {"term": 1, "termKey": 1}):
+            key = self.normalize_term(doc.get("term") or "")
+            winner = keep.get(key)
+            if winner is None or winner["_id"] != doc["_id"]:
+                duplicates.append(doc["_id"])
+            elif doc.get("termKey") != key:
+                self.glossary_collection.update_one({"_id": doc["_id"]}, {"$set": {"termKey": key}})
+                backfilled += 1
+        for start in range(0, len(duplicates), config.glossary_import_batch_size):
+            batch = duplicates[start:start + config.glossary_import_batch_size]
+            deleted += self.glossary_collection.delete_many({"_id": {"$in": batch}}).deleted_count
+
+        self.glossary_collection.create_index(
+            "termKey",
+            name="termKey_unique",
+            unique=True,
+            partialFilterExpression={"termKey": {"$exists": True}}
+        )
+
+        # Cached answers may have used a definition that was just deleted
+        if backfilled or deleted:
+            version_service.bump("glossary")
+        logger.info(f"Glossary term keys back-filled: {backfilled}, duplicates deleted: {deleted}")
+        return {"backfilled": backfilled, "deleted": deleted}
+
+    @classmethod
+    def _resolve_duplicates(cls, docs):
+        """
+        Pick one document per normalized term, in order of first appearance: a document carrying the
+        term key wins (it is the one upserts write to), otherwise the most recently inserted one.
+        Documents written before the term key migration may still have duplicates.
+        """
+        chosen = {}
+        for doc in docs:
+            key = cls.normalize_term(doc.get("term") or "")
+            if not key:
+                continue
+            current = chosen.get(key)
+            if current is None or cls._duplicate_rank(doc) > cls._duplicate_rank(current):
+                chosen[key] = doc
+        return chosen
+
+    @staticmethod
+    def _duplicate_rank(doc):
+        return ("termKey" in doc, doc["_id"])
+
+    @staticmethod
+    def normalize_term(term):
+        """Key used to deduplicate terms: case-folded with whitespace collapsed."""
+        return " ".join(str(term).casefold().split())
+
     def add_glossary_items(self, items: list) -> dict:
         """
         Expects items as a list of dictionaries, each with keys "Term" and "Definition".
-        Stores each item as a separate document.
+        Upserts each item on its normalized term, so re-posting a glossary does not duplicate terms.
+        """
+        counts = self._upsert_batch(items)
+        if not counts["inserted"] and not counts["updated"] and not counts["unchanged"]:
+            return {"message": "No valid glossary items provided.", **counts}
+        return {"message": f"{counts['inserted'] + counts['updated']} glossary items saved.", **counts}
+
+    def import_glossary_items(self, items, batch_size=None) -> dict:
+        """
+        Upsert glossary items from any iterable (for example a streamed request body) in batches.
+        The matcher is rebuilt once at the end rather than after every batch.
+        Returns inserted/updated/skipped counts.
         """
-        docs = []
+        batch_size = batch_size or config.glossary_import_batch_size
+        totals = {"inserted": 0, "updated": 0, "unchanged": 0, "invalid": 0, "duplicates": 0}
+
+        batch = []
         for item in items:
-            term = item.get("Term")
-            definition = item.get("Definition")
-            if not term or not definition:
+            batch.append(item)
+            if len(batch) >= batch_size:
+                self._accumulate(totals, self._upsert_batch(batch, build=False))
+                batch = []
+        if batch:
+            self._accumulate(totals, self._upsert_batch(batch, build=False))
+        if self.matcher is not None:
+            self._build_matcher()
+
+        totals["skipped"] = totals["unchanged"] + totals["invalid"] + totals["duplicates"]
+        logger.info(f"Glossary import finished: {totals}")
+        return totals
+
+    @staticmethod
+    def _accumulate(totals, counts):
+        for key in totals:
+            totals[key] += counts.get(key, 0)
+
+    def _upsert_batch(self, items, build=True) -> dict:
+        """
+        Upsert one batch with an unordered bulk write; the last occurrence of a term in the batch wins.
+        The new terms are added to the matcher, which is rebuilt unless build is False.
+        """
+        latest = {}
+        invalid = 0
+        for item in items:
+            term = item.get("Term") if isinstance(item, dict) else None
+            definition = item.get("Definition") if isinstance(item, dict) else None
+            key = self.normalize_term(term) if term else ""
+            if not key or not definition:
                 logger.error("Both 'Term' and 'Definition' are required for each glossary item.")
+                invalid += 1
                 continue
-            docs.append({
-                "term": term,
-                "definition": definition,
-                "createdAt": datetime.utcnow()
-            })
-        if not docs:
-            return {"message": "No valid glossary items provided."}
-        # result = glossary_collection.insert_many(docs)
-        result = self.glossary_collection.insert_many(docs)
-        return {"message": f"{len(result.inserted_ids)} glossary items saved."}
+            latest[key] = (term.strip(), definition)
+
+        counts = {"inserted": 0, "updated": 0, "unchanged": 0, "invalid": invalid,
+                  "duplicates": len(items) - invalid - len(latest)}
+        if not latest:
+            counts["skipped"] = counts["invalid"] + counts["duplicates"]
+            return counts
+
+        now = datetime.utcnow()
+        operations = [
+            UpdateOne(
+                {"termKey": key},
+                {"$set": {"term": term, "definition": definition},
+                 "$setOnInsert": {"termKey": key, "createdAt": now}},
+                upsert=True
+            )
+            for key, (term, definition) in latest.items()
+        ]
+        result = self.glossary_collection.bulk_write(operations, ordered=False)
+
+        counts["inserted"] = result.upserted_count
+        counts["updated"] = result.modified_count
+        counts["unchanged"] = result.matched_count - result.modified_count
+        counts["skipped"] = counts["unchanged"] + counts["invalid"] + counts["duplicates"]
+
+        # Cached answers used the previous glossary
+        bumped = None
+        if counts["inserted"] or counts["updated"]:
+            bumped = version_service.bump("glossary")
+
+        # Apply the batch to the in-memory matcher instead of reloading the collection
+        if self.matcher is not None:
+            with self.swap_lock:
+                for key, (term, definition) in latest.items():
+                    self.definitions[key] = []
+                    self._add_term(self.matcher, self.definitions, term, definition)
+                # Any other bump is a write from another worker that only a refresh picks up
+                if bumped is not None and bumped == self.applied_version + 1:
+                    self.applied_version = bumped
+            if build:
+                self._build_matcher()
+
+        return counts
 
     def get_all_glossary_items(self) -> list:
-        """Returns all glossary entries as a list of dictionaries."""
+        """Returns all glossary entries as a list of dictionaries, one per term."""
         # cursor = glossary_collection.find({})
         cursor = self.glossary_collection.find()
         items = []
-        for doc in cursor:
+        for doc in self._resolve_duplicates(cursor).values():
             items.append({
                 "Term": doc.get("term"),
                 "Definition": doc.get("definition")
@@ -52,21 +206,88 @@ class GlossaryHandler:
 
     def get_glossary_for_query(self, query: str) -> str:
         """
-        Searches glossary items whose term appears in the query (case-insensitive)
-        and returns their definitions concatenated by newline.
+        Finds glossary items whose term appears in the query as a whole word (case-insensitive)
+        and returns them as "term: definition" lines in order of appearance.
         """
-        query_lower = query.lower()
-        # cursor = glossary_collection.find({})
-        cursor = self.glossary_collection.find()
-        matched = []
-        for doc in cursor:
-            term = doc.get("term", "")
-            if term.lower() in query_lower:
-                definition = doc.get("definition", "")
-                # Format the term and definition together in a string
-                matched.append(f"{term}: {definition}")
-
-            # Return the matched terms and definitions, separated by newlines
+        # Format the term and definition together in a string
+        matched = [f"{term}: {definition}" for term, definition in self.match_glossary(query)]
+
+        # Return the matched terms and definitions, separated by newlines
         return "\n".join(matched) if matched else ""
 
+    def match_glossary(self, query: str) -> list:
+        """Returns the (term, definition) pairs whose term appears in the query, in order of appearance."""
+        self._ensure_loaded()
+
+        matched = []
+        for key in self.matcher.find(query):
+            matched.extend(self.definitions.get(key, []))
+        return matched
+
+    def current_version(self):
+        """Glossary version of the matcher queries use right now, None before the first load; answers are keyed on it."""
+        # The first load happens in the glossary stage, under its timeout
+        if self.matcher is not None:
+            self._ensure_loaded()
+        return self.matcher_version
+
+    def refresh(self):
+        """Reload all glossary terms from MongoDB and swap in a freshly built matcher."""
+        # Read before the terms, so the matcher holds at least this version
+        version = version_service.get("glossary")
+        matcher = TermMatcher()
+        definitions = {}
+        docs = self.glossary_collection.find({}, {"term": 1, "definition": 1, "termKey": 1})
+        for doc in self._resolve_duplicates(docs).values():
+            self._add_term(matcher, definitions, doc.get("term", ""), doc.get("definition", ""))
+        matcher.build()
+
+        with self.swap_lock:
+            self.matcher, self.definitions = matcher, definitions
+            self.applied_version = self.matcher_version = version
+        self.loaded_at = time.monotonic()
+        logger.info(f"Loaded {len(matcher)} glossary terms into the matcher")
+
+    def _ensure_loaded(self):
+        if self.matcher is None:
+            with self.refresh_lock:
+                if self.matcher is None:
+                    self.refresh()
+            return
+
+        # Refresh in the background so queries keep using the current matcher meanwhile; a version
+        # the matcher does not hold yet means another worker changed the glossary
+        due = time.monotonic() - self.loaded_at > config.glossary_refresh_seconds
+        if due or version_service.get("glossary") != self.applied_version:
+            with self.refresh_lock:
+                if self.refreshing:
+                    return
+                self.refreshing = True
+            threading.Thread(target=self._background_refresh, daemon=True).start()
+
+    def _build_matcher(self):
+        """Rebuild the automaton of the current matcher and record the version of the terms it now matches."""
+        with self.swap_lock:
+            matcher, version = self.matcher, self.applied_version
+        matcher.build()
+        with self.swap_lock:
+            # A refresh may have swapped in another matcher meanwhile, which carries its own version
+            if self.matcher is matcher:
+                self.matcher_version = max(self.matcher_version, version)
+
+    def _background_refresh(self):
+        try:
+            self.refresh()
+        except Exception as e:
+            logger.error(f"Glossary refresh failed: {e}")
+            self.loaded_at = time.monotonic()
+        finally:
+            self.refreshing = False
 
+    @classmethod
+    def _add_term(cls, matcher, definitions, term, definition):
+        if not term:
+            return
+        key = cls.normalize_term(term)
+        definitions.setdefault(key, []).append((term, definition))
+        matcher.add(key, key=key)
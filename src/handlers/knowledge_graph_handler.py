@@ -1,79 +1,91 @@
-import os
 import hashlib
-import pickle
 import io
-import fitz
-from langchain_core.runnables import RunnablePassthrough
-from langchain_core.prompts import ChatPromptTemplate
-from langchain_core.output_parsers import StrOutputParser
-# from langchain_community.graphs import Neo4jGraph
-from langchain.text_splitter import RecursiveCharacterTextSplitter
-# from langchain_experimental.graph_transformers import LLMGraphTransformer
-from langchain_community.document_loaders import PyMuPDFLoader
-from langchain_community.llms import DeepInfra
-from neo4j import GraphDatabase
-from langchain_experimental.graph_transformers import LLMGraphTransformer
+import os
+import tempfile
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
 from langchain_core.documents import Document
-from dotenv import load_dotenv
-from pydantic import BaseModel, Field
-from langchain_community.graphs import Neo4jGraph
-from langchain_community.document_loaders import TextLoader
-from yfiles_jupyter_graphs import GraphWidget
-from PyPDF2 import PdfReader
-from paddleocr import PaddleOCR
-from langchain_groq import ChatGroq
 from neo4j import Query
 
 from src.config.config import Config
 from src.config.logging_config import setup_logging
+from src.services.connection_registry import registry
+from src.services.graph_writer import GraphWriter
+from src.services.extraction_cache import ExtractionCache
+from src.services.ocr_service import OcrService
+
+# PDF parsing, the text splitter, the Groq client and LLMGraphTransformer are imported on first
+# use so that processes which only answer queries do not pay for loading them.
 
 config = Config()
 logger = setup_logging(config.logging_config)
 
 
 class KnowledgeGraphHandler:
-    def __init__(self, config):
-        # Initialize Neo4j driver with credentials from Config
+    def __init__(self, config, connect=True, graph_writer=None, ocr_service=None):
+        """
+        connect=False creates an offline handler without a Neo4j connection, for parsing only or for
+        writing through another graph_writer (see CsvGraphWriter). ocr_service replaces the default OCR pool.
+        """
         self.config = config
-        self.neo4j_uri = config.neo4j_uri
-        self.neo4j_username = config.neo4j_username
-        self.neo4j_password = config.neo4j_password
 
-        
-        try:
-            self.driver = GraphDatabase.driver(
-            self.neo4j_uri,
-            auth=(self.neo4j_username, self.neo4j_password))
-            
-            self.graph = Neo4jGraph(
-                url=self.neo4j_uri,
-                username=self.neo4j_username,
-                password=self.neo4j_password
-            )
-            
-            logger.info("Successfully connected to neo4j services")
-        
-        except Exception as e:
-            logger.error("Error connecting to neo4j services")
-            raise ConnectionError(f"Unable to connect tp neo4j: {e}")
+        # Shared pooled Neo4j driver
+        self.driver = registry.neo4j_driver if connect else None
 
-        # Initialize OCR
-        self.ocr = PaddleOCR(use_angle_cls=True, lang="en")
+        self.graph_writer = graph_writer
+        if self.graph_writer is None and connect:
+            self.graph_writer = GraphWriter(self.driver, batch_size=config.graph_write_batch_size)
+
+        # OCR runs in a pool of worker processes each holding its own PaddleOCR instance,
+        # started on first use
+        self.ocr_service = ocr_service or OcrService()
 
         # Load the DeepInfra API token for the LLM
         self.deepinfra_api_token = config.deepinfra_api_token
         self.groq_api_key = config.groq_api_key
         self.groq_model = config.groq_model
-        
-        self.llm_groq = ChatGroq(
-            model = self.groq_model,
-            api_key=self.groq_api_key,
-            temperature=0,
-            max_tokens=None
+
+        # LLM and graph transformer are built on first use, see llm_transformer
+        self._llm_transformer = None
+        self._lazy_lock = threading.Lock()
+
+        # Cache of extraction results keyed by chunk content, model and prompt version
+        self.extraction_cache = ExtractionCache() if config.extraction_cache_enabled else None
+
+        # Shared pool bounding the number of concurrent LLM extraction calls
+        self.extraction_executor = ThreadPoolExecutor(
+            max_workers=config.extraction_concurrency,
+            thread_name_prefix="graph-extraction"
         )
 
-        # Initialize LLM Tranformer
-        self.llm_transformer = LLMGraphTransformer(llm=self.llm_groq)
+    @property
+    def llm_transformer(self):
+        """LLMGraphTransformer over the Groq model, created on first use."""
+        if self._llm_transformer is None:
+            with self._lazy_lock:
+                if self._llm_transformer is None:
+                    from langchain_groq import ChatGroq
+                    from langchain_experimental.graph_transformers import LLMGraphTransformer
+
+                    self.llm_groq = ChatGroq(
+                        model = self.groq_model,
+                        api_key=self.groq_api_key,
+                        temperature=0,
+                        max_tokens=None
+                    )
+
+                    # Initialize LLM Tranformer
+                    self._llm_transformer = LLMGraphTransformer(llm=self.llm_groq)
+        return self._llm_transformer
+
+    def warm_up(self):
+        """Load the graph transformer and start the OCR workers ahead of the first document."""
+        logger.info("Warming up knowledge graph handler...")
+        self.llm_transformer
+        self.ocr_service.warm_up()
+        logger.info("Knowledge graph handler warmed up")
         
         
     # def process_document(self, pdf_content):
@@ -102,74 +114,168 @@ class KnowledgeGraphHandler:
     #     self.create_knowledge_graph(chunks)
     #     logger.info("Successfully created knowledge graph")
 
-    def process_document(self, pdf_content):
-        try:
-            logger.info("Starting document processing...")
-            extracted_text = ""
+    def process_document(self, pdf_source, progress=None, filename=None, document_id=None, document_hash=None):
+        """
+        Extract, chunk and write a PDF (a file path or bytes) into the knowledge graph.
 
-            pdf_reader = PdfReader(io.BytesIO(pdf_content))
-            for page in pdf_reader.pages:
-                page_text = page.extract_text()
-                if page_text:
-                    extracted_text += page_text
+        The stages are chained generators (pages -> text -> chunks -> extraction -> graph writes),
+        so only a window of chunks is held in memory and the first entities are written while later
+        pages are still being read. Given a path, the PDF itself is never read into memory. progress, if given, is called as progress(stage, **counts).
 
-            if not extracted_text.strip():
-                logger.info("Trying OCR...")
-                extracted_text = self.extracted_text_using_ocr(pdf_content)
-
-            logger.info(f"Extracted text: {extracted_text[:500]}...")
-
-            chunks = self.split_text_into_chunks(extracted_text)
-            logger.info(f"Chunks created: {len(chunks)}")
+        The graph is linked to a Document node keyed by the SHA-256 of the PDF (the hash StorageService
+        stores) and document_id is the id of its metadata record. Chunks shared with an earlier version are
+        not extracted again; the caller removes that version with delete_document once the new one is stored.
+        """
+        progress = progress or (lambda stage, **counts: None)
+        try:
+            logger.info("Starting document processing...")
+            document = {
+                "id": document_hash or self.hash_pdf(pdf_source),
+                "filename": filename,
+                "documentId": document_id,
+            }
+            page_texts = self.iter_page_texts(pdf_source, progress=progress)
+            chunks = self.iter_chunks(page_texts)
 
-            self.create_knowledge_graph(chunks)
+            result = self.create_knowledge_graph(chunks, progress=progress, document=document)
+            result["document"] = document["id"]
             logger.info("Knowledge graph created successfully")
+            return result
 
         except Exception as e:
             logger.error(f"Error during document processing: {e}", exc_info=True)
             raise e
 
-    def extracted_text_using_ocr(self, pdf_content):
-        """Extract text from a PDF using PaddleOCR for all pages."""
-        extracted_text = []
+    def hash_pdf(self, pdf_source):
+        """SHA-256 of a PDF given as a file path (read in blocks) or bytes."""
+        if not isinstance(pdf_source, str):
+            return hashlib.sha256(pdf_source).hexdigest()
+        digest = hashlib.sha256()
+        with open(pdf_source, "rb") as f:
+            for block in iter(lambda: f.read(self.config.upload_read_size), b""):
+                digest.update(block)
+        return digest.hexdigest()
 
-        # Open the PDF from bytes
-        pdf_document = fitz.open("pdf", pdf_content)
+    def iter_page_texts(self, pdf_source, progress=None):
+        """
+        Yield the text of each page of a PDF (a file path or bytes) in page order.
+        Pages without a usable text layer are OCRed in the OCR process pool; consecutive scanned pages
+        are sent as one task, and text pages are yielded as soon as every page before them is done.
+        OCR tasks get the path of the PDF rather than a copy of its content; PDFs given as bytes are
+        written to a temporary file once when the first page needs OCR.
+        """
+        from PyPDF2 import PdfReader
 
-        # Loop through all pages
-        for page_num in range(len(pdf_document)):
-            page = pdf_document.load_page(page_num)
+        progress = progress or (lambda stage, **counts: None)
+        pdf_path = pdf_source if isinstance(pdf_source, str) else None
+        pdf_reader = PdfReader(pdf_path or io.BytesIO(pdf_source))
+        pages_total = len(pdf_reader.pages)
+        pages_per_task = self.config.ocr_pages_per_task
+        max_pending = max(self.config.ocr_workers, 1) * 2
 
-            # Extract image from page
-            pix = page.get_pixmap()  # Get a pixmap (image) of the page
-            img_data = pix.tobytes("png")  # Convert to PNG byte format for OCR
+        # Page texts (str) and OCR futures (resolving to a list of texts), in page order
+        pending = deque()
+        ocr_batch = []
+        ocr_pages = 0
+        spooled_path = None
 
-            # Perform OCR on the image
-            results = self.ocr.ocr(img_data, cls=True)  # OCR with PaddleOCR
-            page_text = ""
-            # for line in results[0]:
-            #     page_text += f"{line[1][0]}\n"  # Extract text from OCR results
-            # extracted_text.append(page_text)
+        def flush_ocr_batch():
+            nonlocal pdf_path, spooled_path
+            if ocr_batch:
+                if pdf_path is None:
+                    fd, spooled_path = tempfile.mkstemp(suffix=".pdf")
+                    with os.fdopen(fd, "wb") as f:
+                        f.write(pdf_source)
+                    pdf_path = spooled_path
+                pending.append(self.ocr_service.submit(pdf_path, list(ocr_batch)))
+                ocr_batch.clear()
 
-            if results[0]:
-                for line in results[0]:
-                    page_text += f"{line[1][0]}\n"
-                extracted_text.append(page_text)
+        def drain(final=False):
+            # Yield finished pages from the head; wait on OCR only at the end or when too far ahead
+            while pending:
+                head = pending[0]
+                if isinstance(head, str):
+                    yield pending.popleft()
+                elif final or head.done() or len(pending) > max_pending:
+                    yield from pending.popleft().result()
+                else:
+                    return
 
-        pdf_document.close()
-        return "\n".join(extracted_text)
-            
-        
+        try:
+            for page_num, page in enumerate(pdf_reader.pages):
+                page_text = page.extract_text() or ""
+                if len(page_text.strip()) >= self.config.ocr_min_text_chars:
+                    flush_ocr_batch()
+                    pending.append(page_text)
+                else:
+                    ocr_batch.append(page_num)
+                    ocr_pages += 1
+                    if len(ocr_batch) >= pages_per_task:
+                        flush_ocr_batch()
+
+                progress("extracting_text", pages_done=page_num + 1, pages_total=pages_total, ocr_pages=ocr_pages)
+                for text in drain():
+                    if text.strip():
+                        yield text
+
+            flush_ocr_batch()
+            for text in drain(final=True):
+                if text.strip():
+                    yield text
+        finally:
+            if spooled_path is not None:
+                for future in pending:
+                    if not isinstance(future, str) and not future.cancel():
+                        # Let OCR tasks still reading the file finish, e.g. when the consumer stopped early
+                        future.exception()
+                os.remove(spooled_path)
+
+        if ocr_pages:
+            logger.info(f"OCR used for {ocr_pages} of {pages_total} pages")
 
     def split_text_into_chunks(self, raw_text, chunk_size=500, chunk_overlap=100):
         """Split text into manageable chunks using RecursiveCharacterTextSplitter."""
+        from langchain.text_splitter import RecursiveCharacterTextSplitter
+
         # Initialize the text splitter
         text_splitter = RecursiveCharacterTextSplitter(chunk_size=chunk_size, chunk_overlap=chunk_overlap)
 
         # Split the raw text into chunks
         chunks = [Document(page_content=chunk) for chunk in text_splitter.split_text(raw_text)]
         return chunks
-    
+
+    def iter_chunks(self, page_texts, chunk_size=500, chunk_overlap=100):
+        """
+        Lazily split a stream of page texts into chunks.
+        The tail of the text, starting at the last (possibly incomplete) chunk, is carried over to the
+        next page, so chunks and their overlap continue across page boundaries.
+        """
+        from langchain.text_splitter import RecursiveCharacterTextSplitter
+
+        text_splitter = RecursiveCharacterTextSplitter(
+            chunk_size=chunk_size, chunk_overlap=chunk_overlap, add_start_index=True
+        )
+
+        buffer = ""
+        for page_text in page_texts:
+            buffer = f"{buffer}\n{page_text}" if buffer else page_text
+            if len(buffer) <= chunk_size:
+                continue
+
+            pieces = text_splitter.create_documents([buffer])
+            if len(pieces) < 2:
+                continue
+            for piece in pieces[:-1]:
+                yield Document(page_content=piece.page_content)
+
+            last = pieces[-1]
+            start_index = last.metadata.get("start_index", -1)
+            buffer = buffer[start_index:] if start_index >= 0 else last.page_content
+
+        if buffer.strip():
+            for chunk in text_splitter.split_text(buffer):
+                yield Document(page_content=chunk)
+
     # def create_knowledge_graph(self, chunks):
     #     # generate graph documents using LLM
     #     graph_documents = self.llm_transformer.convert_to_graph_documents(chunks)
@@ -181,48 +287,171 @@ class KnowledgeGraphHandler:
     #     self.logger.info("Graph document has been processed and saved to the knowledge graph.")
     #
     #     self.create_fulltext_index()
-    def create_knowledge_graph(self, chunks):
+    def create_knowledge_graph(self, chunks, progress=None, document=None):
+        """
+        Extract and write the chunks window by window.
+        chunks may be any iterable, including a generator; it is consumed lazily.
+
+        With a document ({"id", "filename", "documentId"}), chunks are recorded as Chunk nodes keyed by the
+        SHA-256 of their text; chunks already extracted for any document are linked instead of re-extracted,
+        and once all chunks are written, chunks the document no longer has are removed from the graph.
+        """
+        progress = progress or (lambda stage, **counts: None)
+        counts = {"nodes": 0, "relationships": 0, "transactions": 0, "chunks": 0, "reused_chunks": 0,
+                  "failed_chunks": []}
+        chunk_ids = set()
+        attempted = 0
+        extracted = 0
         try:
-            graph_documents = self.llm_transformer.convert_to_graph_documents(chunks)
-            logger.info(f"First Graph doc: {graph_documents[0] if graph_documents else 'Empty'}")
-            self.save_to_graph(graph_documents)
+            if document is not None:
+                self.graph_writer.save_document(document)
+
+            for window in self._windows(chunks, self.config.ingest_window_chunks):
+                start_index = counts["chunks"]
+                counts["chunks"] += len(window)
+
+                pending = window
+                if document is not None:
+                    rows = []
+                    for index, chunk in enumerate(window, start=start_index):
+                        chunk_id = hashlib.sha256(chunk.page_content.encode("utf-8")).hexdigest()
+                        chunk.metadata["chunk_id"] = chunk_id
+                        rows.append({"id": chunk_id, "index": index, "text": chunk.page_content})
+                        chunk_ids.add(chunk_id)
+                    self.graph_writer.save_chunks(document["id"], rows)
+
+                    done = self.graph_writer.extracted_chunk_ids(row["id"] for row in rows)
+                    pending = [chunk for chunk in window if chunk.metadata["chunk_id"] not in done]
+                    counts["reused_chunks"] += len(window) - len(pending)
+                    progress("extracting_graph", chunks_done=start_index + len(window) - len(pending))
+
+                attempted += len(pending)
+                graph_documents, failed_chunks = self.extract_graph_documents(
+                    pending, progress=progress, start_index=counts["chunks"] - len(pending)
+                )
+                counts["failed_chunks"].extend(failed_chunks)
+                if not graph_documents:
+                    continue
+
+                if not extracted:
+                    logger.info(f"First Graph doc: {graph_documents[0]}")
+                extracted += len(graph_documents)
+
+                progress("writing_graph", chunks_done=counts["chunks"])
+                window_counts = self.save_to_graph(graph_documents)
+                for key in ("nodes", "relationships", "transactions"):
+                    counts[key] += window_counts[key]
+                if document is not None:
+                    self.graph_writer.mark_chunks_extracted(
+                        {graph_document.source.metadata["chunk_id"] for graph_document in graph_documents}
+                    )
+
+            logger.info(f"Chunks processed: {counts['chunks']} ({counts['reused_chunks']} already in the graph)")
+            if attempted and not extracted:
+                raise RuntimeError(f"Graph extraction failed for all {attempted} chunks")
+
+            if document is not None:
+                progress("pruning_chunks", chunks_done=counts["chunks"])
+                counts["removed"] = self.prune_document_chunks(document, chunk_ids)
+
+            progress("indexing", chunks_done=counts["chunks"], chunks_total=counts["chunks"])
             self.create_fulltext_index()
+            return counts
         except Exception as e:
             logger.error(f"Graph creation failed: {e}", exc_info=True)
             raise e
 
-    # Save the graph documents into the Neo4j knowledge graph
-    def save_to_graph(self, graph_documents):
-        """Save the graph documents into the Neo4j knowledge graph."""
-        with self.driver.session() as session:
-            for graph_document in graph_documents:
-                # Create nodes
-                for node in graph_document.nodes:
-                    session.run(
-                        """
-                        MERGE (n:`{type}` {{id: $id}})
-                        SET n += $properties
-                        SET n:__Entity__
-                        """.format(type=node.type),
-                        id=node.id,
-                        properties=node.properties
-                    )
+    def prune_document_chunks(self, document, chunk_ids):
+        """
+        Drop chunks the document no longer has (e.g. from an earlier run of the same file), deleting the
+        relationships and entities that only they supported. Returns the deletion counts.
+        """
+        removed = self.graph_writer.prune_document_chunks(document["id"], chunk_ids)
 
-                # Create relationships
-                for relationship in graph_document.relationships:
-                    session.run(
-                        """
-                        MATCH (a {{id: $source_id}}), (b {{id: $target_id}})
-                        MERGE (a)-[r:{type}]->(b)
-                        SET r += $properties
-                        """.format(type=relationship.type),
-                        source_id=relationship.source.id,
-                        target_id=relationship.target.id,
-                        properties=relationship.properties
-                    )
-                    
-                logger.info(f"Nodes: List({graph_document.nodes})")
-                logger.info(f"Relationships : List({graph_document.relationships})")
+        if any(removed.values()):
+            logger.info(f"Removed from the graph: {removed}")
+        return removed
+
+    def delete_document(self, document_hash, progress=None):
+        """
+        Remove a document from the knowledge graph in bounded batches, keeping entities and relationships
+        that other documents still support. Returns the deletion counts, or None if the graph has no such document.
+        """
+        counts = self.graph_writer.delete_document(document_hash, progress=progress)
+        if counts is None:
+            logger.info(f"Document {document_hash} has no provenance in the graph, nothing to delete")
+        else:
+            logger.info(f"Deleted document {document_hash} from the graph: {counts}")
+        return counts
+
+    @staticmethod
+    def _windows(items, size):
+        """Group an iterable into lists of at most size items without materializing it."""
+        window = []
+        for item in items:
+            window.append(item)
+            if len(window) >= size:
+                yield window
+                window = []
+        if window:
+            yield window
+
+    def extract_graph_documents(self, chunks, progress=None, start_index=0):
+        """
+        Run LLM graph extraction over the chunks concurrently.
+        Returns the graph documents in chunk order and a list describing the chunks that failed.
+        start_index is the position of the first chunk in the document, used for reporting.
+        """
+        progress = progress or (lambda stage, **counts: None)
+
+        graph_documents = []
+        failed_chunks = []
+        results = self.extraction_executor.map(self._extract_chunk, chunks)
+        for index, (graph_document, error) in enumerate(results, start=start_index):
+            progress("extracting_graph", chunks_done=index + 1)
+            if error is not None:
+                failed_chunks.append({"chunk": index, "error": error})
+            else:
+                graph_documents.append(graph_document)
+
+        if failed_chunks:
+            logger.error(f"Graph extraction failed for {len(failed_chunks)} of {len(chunks)} chunks: {failed_chunks}")
+        if self.extraction_cache is not None:
+            logger.info(f"Extraction cache stats: {self.extraction_cache.stats()}")
+        return graph_documents, failed_chunks
+
+    def _extract_chunk(self, chunk):
+        """Extract a graph document from a single chunk, retrying transient LLM failures."""
+        cache_key = None
+        if self.extraction_cache is not None:
+            cache_key = ExtractionCache.make_key(
+                chunk.page_content, self.groq_model, self.config.extraction_prompt_version
+            )
+            graph_document = self.extraction_cache.get(cache_key)
+            if graph_document is not None:
+                graph_document.source = chunk
+                return graph_document, None
+
+        attempts = self.config.extraction_max_retries + 1
+        for attempt in range(1, attempts + 1):
+            try:
+                graph_document = self.llm_transformer.process_response(chunk)
+                if cache_key is not None:
+                    self.extraction_cache.put(cache_key, graph_document)
+                return graph_document, None
+            except Exception as e:
+                if attempt == attempts:
+                    return None, str(e)
+                logger.info(f"Graph extraction attempt {attempt} failed, retrying: {e}")
+                time.sleep(self.config.extraction_retry_backoff * 2 ** (attempt - 1))
+
+    # Save the graph documents into the Neo4j knowledge graph
+    def save_to_graph(self, graph_documents, batch_size=None):
+        """Save the graph documents into the Neo4j knowledge graph using batched UNWIND writes."""
+        counts = self.graph_writer.save(graph_documents, batch_size=batch_size)
+        logger.info(f"Saved {counts['nodes']} nodes and {counts['relationships']} relationships "
+                    f"in {counts['transactions']} transactions")
+        return counts
 
     # def create_fulltext_index(self):
     #     query_create = '''
@@ -236,7 +465,18 @@ class KnowledgeGraphHandler:
     #     self.logger.info("Fulltext index creation attempted (created if not existing).")
     #
 
+    def create_indexes(self):
+        """
+        Create the indexes and constraints the graph relies on. Not run on construction: call it once
+        from a deploy step (migrate.py) or in the background after startup.
+        """
+        self.create_entity_id_index()
+        self.create_provenance_constraints()
+        self.create_fulltext_index()
+
     def create_fulltext_index(self):
+        if self.driver is None:
+            return
         query_create = '''
         CREATE FULLTEXT INDEX `fulltext_entity_id`
         IF NOT EXISTS
@@ -246,3 +486,35 @@ class KnowledgeGraphHandler:
         with self.driver.session() as session:
             session.run(Query(query_create))  # FIX: wrap with Query()
         logger.info("Fulltext index creation attempted (created if not existing).")
+
+    def create_provenance_constraints(self):
+        """Create the uniqueness constraints on Document and Chunk ids."""
+        statements = [
+            "CREATE CONSTRAINT `document_id` IF NOT EXISTS FOR (d:Document) REQUIRE d.id IS UNIQUE",
+            "CREATE CONSTRAINT `chunk_id` IF NOT EXISTS FOR (c:Chunk) REQUIRE c.id IS UNIQUE",
+        ]
+        try:
+            with self.driver.session() as session:
+                for statement in statements:
+                    session.run(Query(statement))
+            logger.info("Provenance constraints creation attempted (created if not existing).")
+        except Exception as e:
+            logger.error(f"Unable to create provenance constraints: {e}")
+
+    def create_entity_id_index(self):
+        """
+        Create the range index on __Entity__.id used to look up relationship endpoints.
+        A uniqueness constraint is not used because the same id may exist under several labels.
+        """
+        query_create = '''
+        CREATE INDEX `entity_id`
+        IF NOT EXISTS
+        FOR (n:__Entity__)
+        ON (n.id);
+        '''
+        try:
+            with self.driver.session() as session:
+                session.run(Query(query_create))
+            logger.info("Entity id index creation attempted (created if not existing).")
+        except Exception as e:
+            logger.error(f"Unable to create entity id index: {e}")
@@ -1,39 +1,41 @@
+import re
+import threading
+import time
+
 from langchain_core.prompts import ChatPromptTemplate
-from neo4j import GraphDatabase
-from langchain_community.graphs import Neo4jGraph
-from neo4j import GraphDatabase
 from langchain_groq import ChatGroq
 
 from src.config.config import Config
 from src.config.logging_config import setup_logging
+from src.services.connection_registry import registry
+from src.services.context_packer import pack_context, rank_candidates
+from src.services.term_matcher import TermMatcher
+from src.services.version_service import version_service
 
 config = Config()
 logger = setup_logging(config.logging_config)
 
+# Characters with a meaning in Lucene query syntax
+FULLTEXT_SPECIAL_CHARACTERS = set('+-&|!(){}[]^"~*?:\\/')
+
+
+def normalize_entity_text(text):
+    """Case-fold and replace punctuation with spaces so 'Aurora-Conference' matches 'aurora conference'."""
+    return " ".join("".join(char if char.isalnum() else " " for char in text.casefold()).split())
+
+
+def escape_fulltext_query(text):
+    """Escape Lucene syntax so an entity name is searched as plain terms."""
+    return "".join(f"\\{char}" if char in FULLTEXT_SPECIAL_CHARACTERS else char for char in text).strip()
+
+
 class QueryHandler:
-    def __init__(self, config):
-        # Initialize Neo4j driver with credentials from Config
+    def __init__(self, config, cache=None):
         self.config = config
-        self.neo4j_uri = config.neo4j_uri
-        self.neo4j_username = config.neo4j_username
-        self.neo4j_password = config.neo4j_password
-        
-        try:
-            self.driver = GraphDatabase.driver(
-            self.neo4j_uri,
-            auth=(self.neo4j_username, self.neo4j_password))
-            
-            graph = Neo4jGraph(
-                url=self.neo4j_uri,
-                username=self.neo4j_username,
-                password=self.neo4j_password
-            )
-            
-            # self.logger.info("Successfully connected to neo4j services")
-        
-        except Exception as e:
-            logger.error("Error connecting to neo4j services")
-            raise ConnectionError(f"Unable to connect tp neo4j: {e}")
+        self.cache = cache
+
+        # Shared pooled Neo4j driver
+        self.driver = registry.neo4j_driver
         
         # # Load the SpaCy NLP model for named entity recognition
         # self.nlp = spacy.load("en_core_web_sm")
@@ -58,39 +60,258 @@ class QueryHandler:
                     Example output: John Smith, Microsoft, Seattle"""),
             ("user", "{text}")
         ])
+
+        # Same extraction for many numbered questions in one call, used by batch queries
+        self.batch_entity_extraction_prompt = ChatPromptTemplate.from_messages([
+            ("system", """You are an expert at extracting key entities from text.
+                    For each numbered question, extract all important entities (like names, organizations, locations, technical terms, etc.).
+                    Answer with exactly one line per question in the form "<number>: entity, entity".
+                    If a question has no entities, write "<number>:" with nothing after it. Do not include explanations or labels.
+                    Example input:
+                    1. What projects did John Smith work on at Microsoft in Seattle?
+                    2. Who founded Contoso?
+                    Example output:
+                    1: John Smith, Microsoft, Seattle
+                    2: Contoso"""),
+            ("user", "{text}")
+        ])
+
+        # Local gazetteer over the entity ids in the graph, tried before the LLM
+        self.gazetteer = None
+        self.gazetteer_ids = {}
+        self.gazetteer_loaded_at = 0.0
+        self.gazetteer_lock = threading.Lock()
+        self.gazetteer_refreshing = False
+        self.gazetteer_rerun = False
+        # Graph version the current gazetteer was built from; cached entities and context are keyed on it
+        self.gazetteer_version = None
+        if self.cache is not None:
+            self.cache.register_version("gazetteer", self.current_gazetteer_version)
         
         
     def retrieve_context_from_kg(self, question):
+        return self.retrieve(question)["context"]
+
+    def retrieve(self, question):
+        """
+        Return the entities found in the question and the graph context text built from them.
+        Results without entities are marked degraded and not cached, since entity extraction may have failed.
+        """
+        if self.cache is None:
+            return self._retrieve(question)
+
+        key = self.cache.key("context", question)
+        found, result = self.cache.get("context", question, key=key)
+        if found:
+            return result
+
+        start = time.perf_counter()
+        result = self._retrieve(question)
+        if not result.get("degraded"):
+            self.cache.put("context", question, result, time.perf_counter() - start, key=key)
+        return result
+
+    def _retrieve(self, question):
         # entities = [ent[0] for ent in self.extract_entities(question)]
-        entities = self.extract_entities(question)
+        entities = self.extract_question_entities(question)
 
         if not entities:
-            return "No entities found in the question."
+            return self.no_entities_result()
+
+        return self.build_retrieval(entities, self.fetch_graph_data(entities))
+
+    @staticmethod
+    def no_entities_result():
+        # The LLM extraction swallows its errors and returns no entities, so this may be a failure
+        return {"entities": [], "context": "No entities found in the question.", "degraded": ["entities"]}
+
+    def retrieve_batch(self, questions):
+        """
+        retrieve() for many questions: entities are extracted in batched LLM calls and the
+        union of all entities is looked up with a single graph query.
+        Returns a dict of question -> retrieval result.
+        """
+        results = {}
+        missing = []
+        keys = {}
+        for question in dict.fromkeys(questions):
+            if self.cache is not None:
+                keys[question] = self.cache.key("context", question)
+                found, value = self.cache.get("context", question, key=keys[question])
+                if found:
+                    results[question] = value
+                    continue
+            missing.append(question)
+        if not missing:
+            return results
+
+        start = time.perf_counter()
+        entities_by_question = self.extract_entities_batch(missing)
+        all_entities = list(dict.fromkeys(
+            entity for entities in entities_by_question.values() for entity in entities
+        ))
+        data = self.fetch_graph_data(all_entities) if all_entities else self.empty_graph_data()
+        # Shared work is credited evenly to the questions that used it
+        cost = (time.perf_counter() - start) / len(missing)
+
+        for question in missing:
+            entities = entities_by_question.get(question, [])
+            if entities:
+                result = self.build_retrieval(entities, data)
+            else:
+                result = self.no_entities_result()
+            if self.cache is not None and not result.get("degraded"):
+                self.cache.put("context", question, result, cost, key=keys[question])
+            results[question] = result
+        return results
+
+    def fetch_graph_data(self, entities):
+        """Run the graph query of the configured retrieval mode for the entities."""
+        if self.config.retrieval_mode == "ranked":
+            return self.fetch_ranked_candidates(entities)
+        return self.fetch_entity_context(entities)
+
+    def empty_graph_data(self):
+        return [] if self.config.retrieval_mode == "ranked" else {}
+
+    def build_retrieval(self, entities, data):
+        """Build the retrieval result for the entities from graph data that may also cover other entities."""
+        if self.config.retrieval_mode == "ranked":
+            wanted = set(entities)
+            candidates = [candidate for candidate in data if candidate["entity"] in wanted]
+            ranked = rank_candidates(candidates, self.config.retrieval_hop_decay)
+            context, stats, documents = pack_context(entities, ranked, self.config.retrieval_token_budget)
+            logger.info(f"Packed graph context: {stats}")
+            return {"entities": entities, "context": context, "stats": stats, "documents": documents}
+
+        outputs_by_entity = {}
+        documents = []
+        for entity in dict.fromkeys(entities):
+            found = data.get(entity)
+            if found:
+                outputs_by_entity[entity] = found["outputs"]
+                documents.extend(document for document in found["documents"] if document not in documents)
+        return {
+            "entities": entities,
+            "context": self.format_entity_context(entities, outputs_by_entity),
+            "documents": documents,
+        }
+
+    def fetch_entity_context(self, entities):
+        """
+        Look up all entities with one UNWIND query: fulltext match and 1-hop expansion run server-side.
+        Returns a dict of entity -> {"outputs": list of "source - TYPE -> target" triples (at most 50),
+        "documents": the source documents of the matched nodes}.
+        """
+        rows = []
+        for entity in dict.fromkeys(entities):
+            query = escape_fulltext_query(entity)
+            if query:
+                rows.append({"entity": entity, "query": query})
+        if not rows:
+            return {}
 
-        result = ""
         with self.driver.session() as session:
-            for entity in entities:
-                response = session.run(
-                    """
-                    CALL db.index.fulltext.queryNodes('fulltext_entity_id', $query, {limit: 2})
-                    YIELD node, score
-                    CALL (node, node)  {
-                        MATCH (node)-[r]->(neighbor)
+            response = session.run(
+                """
+                UNWIND $rows AS row
+                CALL db.index.fulltext.queryNodes('fulltext_entity_id', row.query, {limit: 2})
+                YIELD node, score
+                WITH row, node, COLLECT {
+                    MATCH (node)<-[:MENTIONS]-(:Chunk)<-[:HAS_CHUNK]-(d:Document)
+                    RETURN DISTINCT d {.id, .documentId, .filename}
+                } AS documents
+                CALL (node) {
+                    CALL (node) {
+                        MATCH (node)-[r]->(neighbor:__Entity__)
                         RETURN node.id + ' - ' + type(r) + ' -> ' + neighbor.id AS output
                         UNION ALL
-                        MATCH (node)<-[r]-(neighbor)
+                        MATCH (node)<-[r]-(neighbor:__Entity__)
                         RETURN neighbor.id + ' - ' + type(r) + ' -> ' + node.id AS output
                     }
-                    RETURN output LIMIT 50
-                    """,
-                    {"query": entity}
-                )
+                    // Stop expanding a high-degree node once it produced enough triples
+                    WITH DISTINCT output LIMIT 50
+                    RETURN output
+                }
+                WITH row.entity AS entity, collect(DISTINCT output) AS outputs, collect(documents) AS document_lists
+                RETURN entity, outputs[..50] AS outputs,
+                       reduce(acc = [], documents IN document_lists | acc + [d IN documents WHERE NOT d IN acc]) AS documents
+                """,
+                {"rows": rows}
+            )
+            return {
+                record["entity"]: {"outputs": record["outputs"], "documents": record["documents"]}
+                for record in response
+            }
+
+    def fetch_ranked_candidates(self, entities):
+        """
+        Collect candidate triples up to RETRIEVAL_MAX_HOPS away from the fulltext matches of each entity,
+        with the fulltext score of the seed node, the hop distance, the degree of the triple's endpoints and
+        the documents of the chunks the triple was extracted from. At most RETRIEVAL_CANDIDATE_LIMIT candidates are returned per entity, best fulltext score first.
+        """
+        rows = []
+        for entity in dict.fromkeys(entities):
+            query = escape_fulltext_query(entity)
+            if query:
+                rows.append({"entity": entity, "query": query})
+        if not rows:
+            return []
 
-                results_for_entity = [record["output"] for record in response]
-                if results_for_entity:
-                    result += f"\nEntity: {entity}\n" + "\n".join(results_for_entity) + "\n"
-                else:
-                    result += f"\nEntity: {entity} - No related context found in the graph.\n"
+        # Variable length bounds cannot be parameters, the hop count is an int from config
+        max_hops = max(1, int(self.config.retrieval_max_hops))
+        with self.driver.session() as session:
+            response = session.run(
+                f"""
+                UNWIND $rows AS row
+                CALL db.index.fulltext.queryNodes('fulltext_entity_id', row.query, {{limit: $fulltext_limit}})
+                YIELD node, score
+                CALL (node) {{
+                    MATCH path = (node)-[*1..{max_hops}]-(:__Entity__)
+                    WHERE all(n IN nodes(path) WHERE n:__Entity__)
+                    WITH path LIMIT $path_limit
+                    UNWIND range(0, length(path) - 1) AS i
+                    RETURN relationships(path)[i] AS r, min(i + 1) AS hop
+                }}
+                WITH row.entity AS entity, r, max(score) AS score, min(hop) AS hop
+                ORDER BY score DESC, hop ASC
+                WITH entity, collect({{r: r, score: score, hop: hop}})[..$candidate_limit] AS candidates
+                UNWIND candidates AS candidate
+                WITH entity, candidate, startNode(candidate.r) AS a, endNode(candidate.r) AS b
+                RETURN entity, a.id AS source, type(candidate.r) AS type, b.id AS target,
+                       candidate.score AS score, candidate.hop AS hop,
+                       COUNT {{ (a)--(:__Entity__) }} + COUNT {{ (b)--(:__Entity__) }} AS degree,
+                       COLLECT {{
+                           UNWIND coalesce(candidate.r.chunkIds, []) AS chunk_id
+                           MATCH (:Chunk {{id: chunk_id}})<-[:HAS_CHUNK]-(d:Document)
+                           RETURN DISTINCT d {{.id, .documentId, .filename}}
+                       }} AS documents
+                """,
+                {
+                    "rows": rows,
+                    "fulltext_limit": self.config.retrieval_fulltext_limit,
+                    "path_limit": self.config.retrieval_path_limit,
+                    "candidate_limit": self.config.retrieval_candidate_limit,
+                }
+            )
+            return [record.data() for record in response]
+
+    @staticmethod
+    def format_entity_context(entities, outputs_by_entity):
+        """Render the per-entity triples as context text, listing each triple only under the first entity that found it."""
+        result = ""
+        seen = set()
+        for entity in dict.fromkeys(entities):
+            results_for_entity = outputs_by_entity.get(entity, [])
+            if results_for_entity:
+                new_results = [output for output in results_for_entity if output not in seen]
+                # All of its triples are already listed under an earlier entity
+                if not new_results:
+                    continue
+                seen.update(new_results)
+                result += f"\nEntity: {entity}\n" + "\n".join(new_results) + "\n"
+            else:
+                result += f"\nEntity: {entity} - No related context found in the graph.\n"
 
         return result
 
@@ -99,7 +320,182 @@ class QueryHandler:
     #     return [(ent.text, ent.label_) for ent in doc.ents]
     #
 
+    def extract_question_entities(self, question):
+        """extract_entities through the entity cache; empty results are not cached since they may be LLM failures."""
+        if self.cache is None:
+            return self.extract_entities(question)
+
+        key = self.cache.key("entities", question)
+        found, entities = self.cache.get("entities", question, key=key)
+        if found:
+            return entities
+
+        start = time.perf_counter()
+        entities = self.extract_entities(question)
+        if entities:
+            self.cache.put("entities", question, entities, time.perf_counter() - start, key=key)
+        return entities
+
+    def extract_entities_batch(self, questions):
+        """
+        extract_question_entities for many questions: cache and gazetteer first, then the
+        remaining questions in batched LLM calls. Returns a dict of question -> entities.
+        """
+        results = {}
+        pending = []
+        keys = {}
+        for question in dict.fromkeys(questions):
+            if self.cache is not None:
+                keys[question] = self.cache.key("entities", question)
+                found, entities = self.cache.get("entities", question, key=keys[question])
+                if found:
+                    results[question] = entities
+                    continue
+            entities = self.match_gazetteer(question) if self.config.gazetteer_enabled else []
+            if entities:
+                results[question] = entities
+                if self.cache is not None:
+                    self.cache.put("entities", question, entities, key=keys[question])
+                continue
+            pending.append(question)
+
+        batch_size = self.config.entity_batch_size
+        for offset in range(0, len(pending), batch_size):
+            batch = pending[offset:offset + batch_size]
+            start = time.perf_counter()
+            extracted = self.extract_entities_with_llm_batch(batch)
+            cost = (time.perf_counter() - start) / len(batch)
+            for question, entities in zip(batch, extracted):
+                results[question] = entities
+                if entities and self.cache is not None:
+                    self.cache.put("entities", question, entities, cost, key=keys[question])
+        return results
+
+    def extract_entities_with_llm_batch(self, questions):
+        """Extract the entities of several questions with one LLM call. Returns one list per question."""
+        if len(questions) == 1:
+            return [self.extract_entities_with_llm(questions[0])]
+
+        try:
+            chain = self.batch_entity_extraction_prompt | self.llm_groq
+            text = "\n".join(f"{number}. {' '.join(question.split())}" for number, question in enumerate(questions, 1))
+            result = chain.invoke({"text": text})
+
+            extracted = [[] for _ in questions]
+            for line in result.content.splitlines():
+                match = re.match(r"\s*(\d+)\s*[:.)]\s*(.*)$", line)
+                if not match:
+                    continue
+                number = int(match.group(1))
+                if 1 <= number <= len(questions):
+                    extracted[number - 1] = [entity.strip() for entity in match.group(2).split(",") if entity.strip()]
+
+            logger.info(f"Extracted entities for {len(questions)} questions in one call")
+            return extracted
+
+        except Exception as e:
+            logger.error(f"Error extracting entities: {e}")
+            return [[] for _ in questions]
+
     def extract_entities(self, text):
+        """Extract entities with the local gazetteer, falling back to the LLM when nothing matches."""
+        if self.config.gazetteer_enabled:
+            entities = self.match_gazetteer(text)
+            if entities:
+                logger.info(f"Gazetteer entities: {entities}")
+                return entities
+        return self.extract_entities_with_llm(text)
+
+    def match_gazetteer(self, text):
+        """
+        Return the graph entity ids mentioned in the text, matched case- and punctuation-insensitively.
+        Until the first background build of the gazetteer finishes nothing is matched and the LLM is used.
+        """
+        gazetteer = self._ensure_gazetteer()
+        if gazetteer is None:
+            return []
+
+        entities = []
+        for key in gazetteer.find(normalize_entity_text(text)):
+            entities.extend(self.gazetteer_ids.get(key, []))
+        return entities
+
+    def refresh_gazetteer(self):
+        """Rebuild the gazetteer from the __Entity__ ids currently in the graph and swap it in."""
+        # Read before the entities, so the graph is at least this version
+        version = version_service.get("graph")
+        matcher = TermMatcher()
+        ids = {}
+        with self.driver.session() as session:
+            response = session.run("MATCH (n:__Entity__) RETURN DISTINCT n.id AS id")
+            for record in response:
+                entity_id = record["id"]
+                if not isinstance(entity_id, str):
+                    continue
+                key = normalize_entity_text(entity_id)
+                if len(key) < self.config.gazetteer_min_length:
+                    continue
+                ids.setdefault(key, []).append(entity_id)
+                matcher.add(key, key=key)
+        matcher.build()
+
+        # Ids first: a query that still holds the previous matcher looks its keys up with get()
+        self.gazetteer_ids = ids
+        self.gazetteer = matcher
+        # Version last: a cache key must never claim a newer graph than the gazetteer in use
+        self.gazetteer_version = version
+        self.gazetteer_loaded_at = time.monotonic()
+        logger.info(f"Loaded {len(matcher)} entity names into the gazetteer")
+
+    def schedule_gazetteer_refresh(self, rerun=True):
+        """
+        Rebuild the gazetteer in a background thread, one build at a time; queries keep the current one meanwhile.
+        With rerun, a request made while a build is running starts one more build after it, so graph
+        changes that landed during the build are picked up.
+        """
+        with self.gazetteer_lock:
+            if self.gazetteer_refreshing:
+                self.gazetteer_rerun = self.gazetteer_rerun or rerun
+                return
+            self.gazetteer_refreshing = True
+        threading.Thread(target=self._background_refresh_gazetteer, name="gazetteer-refresh", daemon=True).start()
+
+    def _ensure_gazetteer(self):
+        """
+        Return the current gazetteer (None before the first build), scheduling a build when it is due
+        or when the graph version moved past the one it was built from.
+        """
+        # Also picks up entities written by other workers
+        due = time.monotonic() - self.gazetteer_loaded_at > self.config.gazetteer_refresh_seconds
+        if due or (self.gazetteer is not None and version_service.get("graph") != self.gazetteer_version):
+            self.schedule_gazetteer_refresh(rerun=False)
+        return self.gazetteer
+
+    def current_gazetteer_version(self):
+        """Graph version of the gazetteer queries use right now; None while it is disabled or not built yet."""
+        if not self.config.gazetteer_enabled:
+            return None
+        self._ensure_gazetteer()
+        return self.gazetteer_version
+
+    def _background_refresh_gazetteer(self):
+        while True:
+            try:
+                self.refresh_gazetteer()
+            except Exception as e:
+                logger.error(f"Gazetteer refresh failed: {e}")
+                self.gazetteer_loaded_at = time.monotonic()
+            with self.gazetteer_lock:
+                if not self.gazetteer_rerun:
+                    self.gazetteer_refreshing = False
+                    return
+                self.gazetteer_rerun = False
+        # Graph version the current gazetteer was built from; cached entities and context are keyed on it
+        self.gazetteer_version = None
+        if self.cache is not None:
+            self.cache.register_version("gazetteer", self.current_gazetteer_version)
+
+    def extract_entities_with_llm(self, text):
         try:
             # Create the chain for entity extraction
             chain = self.entity_extraction_prompt | self.llm_groq
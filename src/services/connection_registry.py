@@ -0,0 +1,100 @@
+import atexit
+import threading
+
+from neo4j import GraphDatabase
+from pymongo.mongo_client import MongoClient
+
+from src.config.config import Config
+from src.config.logging_config import setup_logging
+
+config = Config()
+logger = setup_logging(config.logging_config)
+
+
+class ConnectionRegistry:
+    """
+    Process-wide owner of the external clients
+
+    Holds a single pooled Neo4j driver, one MongoClient and one
+    BlobServiceClient, each created on first use with pool sizes and timeouts
+    from Config. Clients are built lazily so that processes forked from a
+    preloading parent create their own connections.
+    """
+
+    def __init__(self, config):
+        self.config = config
+        self._lock = threading.Lock()
+        self._neo4j_driver = None
+        self._mongo_client = None
+        self._blob_service_client = None
+
+    @property
+    def neo4j_driver(self):
+        if self._neo4j_driver is None:
+            with self._lock:
+                if self._neo4j_driver is None:
+                    try:
+                        self._neo4j_driver = GraphDatabase.driver(
+                            self.config.neo4j_uri,
+                            auth=(self.config.neo4j_username, self.config.neo4j_password),
+                            max_connection_pool_size=self.config.neo4j_max_pool_size,
+                            connection_timeout=self.config.neo4j_connection_timeout,
+                            connection_acquisition_timeout=self.config.neo4j_acquisition_timeout
+                        )
+                        logger.info("Successfully connected to neo4j services")
+                    except Exception as e:
+                        logger.error("Error connecting to neo4j services")
+                        raise ConnectionError(f"Unable to connect tp neo4j: {e}")
+        return self._neo4j_driver
+
+    @property
+    def mongo_client(self):
+        if self._mongo_client is None:
+            with self._lock:
+                if self._mongo_client is None:
+                    self._mongo_client = MongoClient(
+                        self.config.mongo_uri,
+                        maxPoolSize=self.config.mongo_max_pool_size,
+                        serverSelectionTimeoutMS=self.config.mongo_timeout_ms,
+                        connectTimeoutMS=self.config.mongo_timeout_ms
+                    )
+                    logger.info("Connected to MongoDB")
+        return self._mongo_client
+
+    @property
+    def blob_service_client(self):
+        if self._blob_service_client is None:
+            with self._lock:
+                if self._blob_service_client is None:
+                    from azure.storage.blob import BlobServiceClient
+
+                    try:
+                        self._blob_service_client = BlobServiceClient.from_connection_string(
+                            self.config.azure_connection_string,
+                            connection_timeout=self.config.azure_connection_timeout,
+                            read_timeout=self.config.azure_read_timeout,
+                            max_block_size=self.config.azure_max_block_size,
+                            max_single_put_size=self.config.azure_max_single_put_size
+                        )
+                    except Exception as e:
+                        logger.error(f"Failed to connect to Azure storage: {e}")
+                        raise
+        return self._blob_service_client
+
+    def close(self):
+        """Close every client that has been created. They are rebuilt if used again."""
+        with self._lock:
+            if self._neo4j_driver is not None:
+                self._neo4j_driver.close()
+                self._neo4j_driver = None
+            if self._mongo_client is not None:
+                self._mongo_client.close()
+                self._mongo_client = None
+            if self._blob_service_client is not None:
+                self._blob_service_client.close()
+                self._blob_service_client = None
+        logger.info("Closed external connections")
+
+
+registry = ConnectionRegistry(config)
+atexit.register(registry.close)
@@ -0,0 +1,92 @@
+import math
+
+# Ranking and packing of graph triples into a token-budgeted context for the LLM prompt.
+# Candidates are dicts with entity, source, type, target, score (fulltext), hop, degree and
+# optionally documents (the source documents of the triple).
+
+# Rough token estimate; close enough for English text with the tokenizers in use
+CHARS_PER_TOKEN = 4
+
+
+def estimate_tokens(text):
+    return math.ceil(len(text) / CHARS_PER_TOKEN)
+
+
+def format_triple(candidate):
+    return f"{candidate['source']} - {candidate['type']} -> {candidate['target']}"
+
+
+def rank_candidates(candidates, hop_decay=0.5):
+    """
+    Score each candidate triple and return the deduplicated triples best first.
+
+    The score is the fulltext score of the seed node (relative to the best seed
+    of the same entity), decayed per extra hop and damped by the degree of the
+    triple's endpoints so hub nodes do not crowd out specific facts.
+    """
+    best_seed_score = {}
+    for candidate in candidates:
+        entity = candidate["entity"]
+        best_seed_score[entity] = max(best_seed_score.get(entity, 0.0), candidate["score"] or 0.0)
+
+    ranked = {}
+    for candidate in candidates:
+        relevance = (candidate["score"] or 0.0) / (best_seed_score[candidate["entity"]] or 1.0)
+        score = relevance * hop_decay ** (candidate["hop"] - 1) / (1.0 + math.log1p(candidate["degree"] or 0))
+
+        triple = format_triple(candidate)
+        documents = candidate.get("documents") or []
+        if triple not in ranked:
+            ranked[triple] = {"entity": candidate["entity"], "triple": triple, "rank": score, "documents": list(documents)}
+            continue
+
+        item = ranked[triple]
+        item["documents"].extend(document for document in documents if document not in item["documents"])
+        if score > item["rank"]:
+            item["entity"], item["rank"] = candidate["entity"], score
+
+    return sorted(ranked.values(), key=lambda item: item["rank"], reverse=True)
+
+
+def pack_context(entities, ranked, token_budget):
+    """
+    Fill the token budget with the best ranked triples, grouped under their entity.
+    Returns the context text, stats on what was included and dropped, and the source
+    documents of the included triples.
+    """
+    selected = {}
+    documents = []
+    used_tokens = 0
+    dropped = 0
+    dropped_tokens = 0
+
+    for item in ranked:
+        cost = estimate_tokens(item["triple"]) + 1
+        if item["entity"] not in selected:
+            cost += estimate_tokens(f"\nEntity: {item['entity']}\n")
+
+        if used_tokens + cost > token_budget:
+            dropped += 1
+            dropped_tokens += estimate_tokens(item["triple"]) + 1
+            continue
+
+        selected.setdefault(item["entity"], []).append(item["triple"])
+        used_tokens += cost
+        documents.extend(document for document in item.get("documents", []) if document not in documents)
+
+    context = ""
+    for entity in dict.fromkeys(entities):
+        if entity in selected:
+            context += f"\nEntity: {entity}\n" + "\n".join(selected[entity]) + "\n"
+        else:
+            context += f"\nEntity: {entity} - No related context found in the graph.\n"
+
+    stats = {
+        "candidates": len(ranked),
+        "triples": len(ranked) - dropped,
+        "droppedTriples": dropped,
+        "tokens": used_tokens,
+        "droppedTokens": dropped_tokens,
+        "tokenBudget": token_budget,
+    }
+    return context, stats, documents
@@ -0,0 +1,202 @@
+import csv
+import os
+import threading
+
+from src.config.config import Config
+from src.config.logging_config import setup_logging
+
+config = Config()
+logger = setup_logging(config.logging_config)
+
+
+class CsvGraphWriter:
+    """
+    Writes the graph GraphWriter would write into CSV files for `neo4j-admin database import`
+
+    Used by the bulk ingest CLI in place of live transactions. Files are only
+    appended to and are read back on start, so an interrupted run continues
+    into the same directory. Entities are keyed "<label>|<id>" in the Entity
+    id space. Relationships are appended one row per extraction to
+    relationships.raw.csv and merged with their chunkIds by finish().
+
+    Chunk nodes are written once their extraction succeeded (extracted=true)
+    or, for the chunks that failed, when the document is finished, which the
+    graph building code signals through prune_document_chunks(). Node and
+    relationship properties returned by the extraction are not exported.
+    """
+
+    FILES = {
+        "documents": ["id:ID(Document)", "filename", "documentId", ":LABEL"],
+        "chunks": ["id:ID(Chunk)", "text", "extracted:boolean", ":LABEL"],
+        "entities": [":ID(Entity)", "id", ":LABEL"],
+        "has_chunk": [":START_ID(Document)", ":END_ID(Chunk)", "index:int", ":TYPE"],
+        "mentions": [":START_ID(Chunk)", ":END_ID(Entity)", ":TYPE"],
+        "relationships.raw": ["source", "type", "target", "chunkId"],
+    }
+    RELATIONSHIPS_HEADER = [":START_ID(Entity)", ":END_ID(Entity)", ":TYPE", "chunkIds:string[]"]
+
+    def __init__(self, output_dir):
+        self.output_dir = output_dir
+        os.makedirs(output_dir, exist_ok=True)
+        self.lock = threading.Lock()
+
+        # Keys already written, rebuilt from the files of a previous run
+        self.documents = {row[0] for row in self._read("documents")}
+        self.chunks = {}
+        for row in self._read("chunks"):
+            self.chunks[row[0]] = row[2] == "true"
+        self.entities = {row[0] for row in self._read("entities")}
+        self.has_chunk = {(row[0], row[1]) for row in self._read("has_chunk")}
+        self.mentions = {(row[0], row[1]) for row in self._read("mentions")}
+
+        # Chunk rows waiting for their extraction result, per document
+        self.pending_chunks = {}
+
+        self.files = {}
+        self.writers = {}
+        for name, header in self.FILES.items():
+            path = self._path(name)
+            is_new = not os.path.exists(path) or os.path.getsize(path) == 0
+            self.files[name] = open(path, "a", newline="", encoding="utf-8")
+            self.writers[name] = csv.writer(self.files[name])
+            if is_new:
+                self.writers[name].writerow(header)
+
+    def _path(self, name):
+        return os.path.join(self.output_dir, f"{name}.csv")
+
+    def _read(self, name):
+        """Yield the complete data rows of a file written by an earlier run."""
+        path = self._path(name)
+        if not os.path.exists(path):
+            return
+        with open(path, newline="", encoding="utf-8") as f:
+            reader = csv.reader(f)
+            next(reader, None)
+            for row in reader:
+                # A row cut short by an interrupted run is skipped
+                if len(row) == len(self.FILES[name]):
+                    yield row
+
+    @staticmethod
+    def entity_key(node):
+        return f"{node.type}|{node.id}"
+
+    def _write_entity(self, node):
+        key = self.entity_key(node)
+        if key not in self.entities:
+            self.entities.add(key)
+            self.writers["entities"].writerow([key, node.id, f"{node.type};__Entity__"])
+        return key
+
+    def _write_chunk(self, chunk_id, text, extracted):
+        if chunk_id not in self.chunks:
+            self.chunks[chunk_id] = extracted
+            self.writers["chunks"].writerow([chunk_id, text, "true" if extracted else "false", "Chunk"])
+
+    def save(self, graph_documents, batch_size=None):
+        """Append the entities, relationships and mentions of the graph documents; same counts as GraphWriter.save."""
+        counts = {"nodes": 0, "relationships": 0, "transactions": 0}
+        with self.lock:
+            for graph_document in graph_documents:
+                source = getattr(graph_document, "source", None)
+                chunk_id = source.metadata.get("chunk_id") if source is not None else None
+
+                keys = [self._write_entity(node) for node in graph_document.nodes]
+                counts["nodes"] += len(graph_document.nodes)
+
+                for relationship in graph_document.relationships:
+                    keys.append(self._write_entity(relationship.source))
+                    keys.append(self._write_entity(relationship.target))
+                    self.writers["relationships.raw"].writerow([
+                        self.entity_key(relationship.source),
+                        relationship.type,
+                        self.entity_key(relationship.target),
+                        chunk_id or ""
+                    ])
+                    counts["relationships"] += 1
+
+                if chunk_id is not None:
+                    for key in dict.fromkeys(keys):
+                        if (chunk_id, key) not in self.mentions:
+                            self.mentions.add((chunk_id, key))
+                            self.writers["mentions"].writerow([chunk_id, key, "MENTIONS"])
+        return counts
+
+    def save_document(self, document):
+        with self.lock:
+            if document["id"] not in self.documents:
+                self.documents.add(document["id"])
+                self.writers["documents"].writerow([
+                    document["id"], document.get("filename") or "", document.get("documentId") or "", "Document"
+                ])
+
+    def save_chunks(self, document_id, chunks):
+        with self.lock:
+            pending = self.pending_chunks.setdefault(document_id, {})
+            for chunk in chunks:
+                if (document_id, chunk["id"]) not in self.has_chunk:
+                    self.has_chunk.add((document_id, chunk["id"]))
+                    self.writers["has_chunk"].writerow([document_id, chunk["id"], chunk["index"], "HAS_CHUNK"])
+                if chunk["id"] not in self.chunks:
+                    pending[chunk["id"]] = chunk["text"]
+
+    def extracted_chunk_ids(self, chunk_ids):
+        with self.lock:
+            return {chunk_id for chunk_id in chunk_ids if self.chunks.get(chunk_id)}
+
+    def mark_chunks_extracted(self, chunk_ids):
+        with self.lock:
+            for chunk_id in chunk_ids:
+                for pending in self.pending_chunks.values():
+                    if chunk_id in pending:
+                        self._write_chunk(chunk_id, pending.pop(chunk_id), True)
+
+    def prune_document_chunks(self, document_id, keep_chunk_ids):
+        """Called once a document is complete: write its chunks whose extraction failed as not extracted."""
+        with self.lock:
+            for chunk_id, text in self.pending_chunks.pop(document_id, {}).items():
+                self._write_chunk(chunk_id, text, False)
+            self.flush()
+        return {"chunks": 0, "relationships": 0, "entities": 0}
+
+    def flush(self):
+        for f in self.files.values():
+            f.flush()
+
+    def finish(self):
+        """
+        Merge relationships.raw.csv into relationships.csv, one row per (source, type, target) with all its chunkIds,
+        close the files and return the neo4j-admin command that imports them.
+        """
+        with self.lock:
+            for document_id in list(self.pending_chunks):
+                for chunk_id, text in self.pending_chunks.pop(document_id).items():
+                    self._write_chunk(chunk_id, text, False)
+            for f in self.files.values():
+                f.close()
+
+            relationships = {}
+            for source, rel_type, target, chunk_id in self._read("relationships.raw"):
+                chunk_ids = relationships.setdefault((source, rel_type, target), [])
+                if chunk_id and chunk_id not in chunk_ids:
+                    chunk_ids.append(chunk_id)
+
+            with open(self._path("relationships"), "w", newline="", encoding="utf-8") as f:
+                writer = csv.writer(f)
+                writer.writerow(self.RELATIONSHIPS_HEADER)
+                for (source, rel_type, target), chunk_ids in relationships.items():
+                    writer.writerow([source, target, rel_type, ";".join(chunk_ids)])
+
+        logger.info(f"Wrote {len(self.documents)} documents, {len(self.chunks)} chunks, {len(self.entities)} entities "
+                    f"and {len(relationships)} relationships to {self.output_dir}")
+        return self.import_command()
+
+    def import_command(self, database="neo4j"):
+        nodes = " ".join(f"--nodes={self._path(name)}" for name in ("documents", "chunks", "entities"))
+        relationships = " ".join(
+            f"--relationships={self._path(name)}" for name in ("has_chunk", "mentions", "relationships")
+        )
+        # Chunk texts span lines, and chunkIds arrays are joined with ";"
+        options = "--multiline-fields=true --array-delimiter=';'"
+        return f"neo4j-admin database import full {options} {nodes} {relationships} {database}"
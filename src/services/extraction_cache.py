@@ -0,0 +1,120 @@
+import hashlib
+import os
+import pickle
+import sqlite3
+import threading
+import time
+
+from src.config.config import Config
+from src.config.logging_config import setup_logging
+
+config = Config()
+logger = setup_logging(config.logging_config)
+
+
+class ExtractionCache:
+    """
+    Persistent cache of LLM graph extraction results
+
+    Entries are serialized GraphDocuments stored in a local SQLite file, keyed
+    by the SHA-256 of the chunk text, the model name and the extraction prompt
+    version. When the stored size exceeds the configured limit the least
+    recently used entries are evicted.
+    """
+
+    def __init__(self, path=None, max_bytes=None):
+        self.path = path or config.extraction_cache_path
+        self.max_bytes = max_bytes or config.extraction_cache_max_bytes
+        os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+
+        self.lock = threading.Lock()
+        self.conn = sqlite3.connect(self.path, timeout=30, check_same_thread=False)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute(
+            "CREATE TABLE IF NOT EXISTS entries "
+            "(key TEXT PRIMARY KEY, value BLOB NOT NULL, size INTEGER NOT NULL, accessed REAL NOT NULL)"
+        )
+        self.conn.execute("CREATE INDEX IF NOT EXISTS entries_accessed ON entries (accessed)")
+        self.conn.commit()
+
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        # Running estimate of the store size, recomputed exactly before evicting
+        self.total_bytes = self._stored_bytes()
+
+    @staticmethod
+    def make_key(text, model, prompt_version):
+        """Build the cache key for a chunk of text extracted with the given model and prompt version."""
+        digest = hashlib.sha256()
+        for part in (model, prompt_version, text):
+            digest.update(str(part).encode("utf-8"))
+            digest.update(b"\0")
+        return digest.hexdigest()
+
+    def get(self, key):
+        """Return the cached GraphDocument for the key, or None on a miss."""
+        with self.lock:
+            row = self.conn.execute("SELECT value FROM entries WHERE key = ?", (key,)).fetchone()
+            if row is None:
+                self.misses += 1
+                return None
+            self.conn.execute("UPDATE entries SET accessed = ? WHERE key = ?", (time.time(), key))
+            self.conn.commit()
+            self.hits += 1
+
+        return pickle.loads(row[0])
+
+    def put(self, key, graph_document):
+        """Store a GraphDocument under the key and evict old entries if the store is over its size limit."""
+        value = pickle.dumps(graph_document, protocol=pickle.HIGHEST_PROTOCOL)
+        with self.lock:
+            self.conn.execute(
+                "INSERT OR REPLACE INTO entries (key, value, size, accessed) VALUES (?, ?, ?, ?)",
+                (key, value, len(value), time.time())
+            )
+            self.conn.commit()
+            self.total_bytes += len(value)
+            if self.total_bytes > self.max_bytes:
+                self._evict()
+
+    def stats(self):
+        """Return hit/miss counters and the current size of the store."""
+        with self.lock:
+            entries, stored_bytes = self.conn.execute(
+                "SELECT COUNT(*), COALESCE(SUM(size), 0) FROM entries"
+            ).fetchone()
+        lookups = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hitRate": self.hits / lookups if lookups else 0.0,
+            "evictions": self.evictions,
+            "entries": entries,
+            "bytes": stored_bytes,
+            "maxBytes": self.max_bytes
+        }
+
+    def _stored_bytes(self):
+        return self.conn.execute("SELECT COALESCE(SUM(size), 0) FROM entries").fetchone()[0]
+
+    def _evict(self):
+        # Other processes may share the file, so work from the exact size
+        self.total_bytes = self._stored_bytes()
+        target = int(self.max_bytes * 0.9)
+
+        while self.total_bytes > target:
+            rows = self.conn.execute(
+                "SELECT key, size FROM entries ORDER BY accessed LIMIT 100"
+            ).fetchall()
+            if not rows:
+                break
+            for key, size in rows:
+                if self.total_bytes <= target:
+                    break
+                self.conn.execute("DELETE FROM entries WHERE key = ?", (key,))
+                self.total_bytes -= size
+                self.evictions += 1
+            self.conn.commit()
+
+        logger.info(f"Extraction cache evicted entries, size is now {self.total_bytes} bytes")
@@ -0,0 +1,73 @@
+import csv
+import io
+import json
+
+# Parsers that turn a streamed request body into glossary items ({"Term": ..., "Definition": ...})
+# one at a time, so large files are never held in memory as a whole.
+
+READ_SIZE = 64 * 1024
+
+
+def iter_csv_items(stream, encoding="utf-8"):
+    """Yield items from a CSV body with a header row containing Term and Definition columns."""
+    reader = csv.DictReader(io.TextIOWrapper(stream, encoding=encoding, newline=""))
+    columns = {name.strip().lower(): name for name in reader.fieldnames or []}
+    term_column = columns.get("term")
+    definition_column = columns.get("definition")
+    if term_column is None or definition_column is None:
+        raise ValueError("CSV header must contain 'Term' and 'Definition' columns.")
+
+    for row in reader:
+        yield {"Term": row.get(term_column), "Definition": row.get(definition_column)}
+
+
+def iter_ndjson_items(stream, encoding="utf-8"):
+    """Yield items from a body with one JSON object per line."""
+    for line in io.TextIOWrapper(stream, encoding=encoding):
+        line = line.strip()
+        if line:
+            yield json.loads(line)
+
+
+def iter_json_array_items(stream, encoding="utf-8"):
+    """Yield the elements of a top-level JSON array, decoding it incrementally."""
+    decoder = json.JSONDecoder()
+    text = io.TextIOWrapper(stream, encoding=encoding)
+    buffer = ""
+    position = 0
+    started = False
+
+    while True:
+        # Skip whitespace and the separators between elements
+        while position < len(buffer) and buffer[position] in " \t\r\n,":
+            position += 1
+
+        if position == len(buffer):
+            chunk = text.read(READ_SIZE)
+            if not chunk:
+                raise ValueError("Unexpected end of JSON array.")
+            buffer, position = chunk, 0
+            continue
+
+        if not started:
+            if buffer[position] != "[":
+                raise ValueError("Expected a JSON array of glossary items.")
+            started = True
+            position += 1
+            continue
+
+        if buffer[position] == "]":
+            return
+
+        try:
+            item, end = decoder.raw_decode(buffer, position)
+        except json.JSONDecodeError:
+            # The element is incomplete, append the next part of the body and retry
+            chunk = text.read(READ_SIZE)
+            if not chunk:
+                raise ValueError("Invalid JSON array of glossary items.")
+            buffer, position = buffer[position:] + chunk, 0
+            continue
+
+        yield item
+        position = end
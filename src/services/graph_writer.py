@@ -0,0 +1,357 @@
+from collections import defaultdict
+
+from src.config.config import Config
+from src.config.logging_config import setup_logging
+
+config = Config()
+logger = setup_logging(config.logging_config)
+
+
+def _quote(name):
+    """Quote a label or relationship type for use inside a Cypher statement."""
+    return "`" + str(name).replace("`", "``") + "`"
+
+
+def _batches(rows, batch_size):
+    for start in range(0, len(rows), batch_size):
+        yield rows[start:start + batch_size]
+
+
+class GraphWriter:
+    """
+    Writes GraphDocuments into Neo4j
+
+    Nodes are grouped by label and relationships by type, and every group is
+    written with a single parameterized UNWIND statement per batch inside a
+    managed write transaction. Relationship endpoints are matched through
+    :__Entity__ so the lookup is served by the `entity_id` index.
+
+    Provenance: a (:Document {id: <pdf sha256>}) has HAS_CHUNK edges to
+    (:Chunk {id: <chunk text sha256>}) nodes, each chunk has MENTIONS edges to
+    the entities extracted from it, and relationships list the chunks they
+    were extracted from in r.chunkIds. Graph documents whose source chunk
+    carries a "chunk_id" in its metadata are written with provenance.
+    """
+
+    def __init__(self, driver, batch_size=None, delete_batch_size=None):
+        self.driver = driver
+        self.batch_size = batch_size or config.graph_write_batch_size
+        # Chunks per deletion transaction; each chunk can carry many mentions and relationships
+        self.delete_batch_size = delete_batch_size or config.graph_delete_batch_size
+
+    def save(self, graph_documents, batch_size=None):
+        """Write all nodes and relationships of the graph documents and return the write counts."""
+        batch_size = batch_size or self.batch_size
+        nodes_by_label, relationships_by_type, mentions = self._group(graph_documents)
+
+        counts = {"nodes": 0, "relationships": 0, "transactions": 0}
+        with self.driver.session() as session:
+            for label, rows in nodes_by_label.items():
+                for batch in _batches(rows, batch_size):
+                    counts["nodes"] += session.execute_write(self._write_nodes, label, batch)
+                    counts["transactions"] += 1
+
+            for rel_type, rows in relationships_by_type.items():
+                for batch in _batches(rows, batch_size):
+                    counts["relationships"] += session.execute_write(self._write_relationships, rel_type, batch)
+                    counts["transactions"] += 1
+
+            for batch in _batches(mentions, batch_size):
+                session.execute_write(self._write_mentions, batch)
+                counts["transactions"] += 1
+
+        return counts
+
+    def save_row_by_row(self, graph_documents):
+        """
+        Write nodes and relationships one auto-commit statement at a time.
+        Kept as the reference path for benchmarking the batched writer.
+        """
+        counts = {"nodes": 0, "relationships": 0, "transactions": 0}
+        with self.driver.session() as session:
+            for graph_document in graph_documents:
+                for node in graph_document.nodes:
+                    session.run(
+                        """
+                        MERGE (n:{label} {{id: $id}})
+                        SET n += $properties
+                        SET n:__Entity__
+                        """.format(label=_quote(node.type)),
+                        id=node.id,
+                        properties=node.properties
+                    ).consume()
+                    counts["nodes"] += 1
+                    counts["transactions"] += 1
+
+                for relationship in graph_document.relationships:
+                    session.run(
+                        """
+                        MATCH (a {{id: $source_id}}), (b {{id: $target_id}})
+                        MERGE (a)-[r:{type}]->(b)
+                        SET r += $properties
+                        """.format(type=_quote(relationship.type)),
+                        source_id=relationship.source.id,
+                        target_id=relationship.target.id,
+                        properties=relationship.properties
+                    ).consume()
+                    counts["relationships"] += 1
+                    counts["transactions"] += 1
+
+        return counts
+
+    @staticmethod
+    def _group(graph_documents):
+        nodes_by_label = defaultdict(list)
+        relationships_by_type = defaultdict(list)
+        mentions = []
+
+        for graph_document in graph_documents:
+            source = getattr(graph_document, "source", None)
+            chunk_id = source.metadata.get("chunk_id") if source is not None else None
+
+            for node in graph_document.nodes:
+                nodes_by_label[node.type].append({
+                    "id": node.id,
+                    "properties": node.properties or {}
+                })
+
+            for relationship in graph_document.relationships:
+                relationships_by_type[relationship.type].append({
+                    "source_id": relationship.source.id,
+                    "target_id": relationship.target.id,
+                    "properties": relationship.properties or {},
+                    "chunk_id": chunk_id
+                })
+
+            if chunk_id is not None:
+                entity_ids = [node.id for node in graph_document.nodes]
+                for relationship in graph_document.relationships:
+                    entity_ids += [relationship.source.id, relationship.target.id]
+                mentions.extend({"chunk_id": chunk_id, "entity_id": entity_id} for entity_id in dict.fromkeys(entity_ids))
+
+        return nodes_by_label, relationships_by_type, mentions
+
+    @staticmethod
+    def _write_nodes(tx, label, rows):
+        tx.run(
+            """
+            UNWIND $rows AS row
+            MERGE (n:{label} {{id: row.id}})
+            SET n += row.properties
+            SET n:__Entity__
+            """.format(label=_quote(label)),
+            rows=rows
+        ).consume()
+        return len(rows)
+
+    @staticmethod
+    def _write_relationships(tx, rel_type, rows):
+        tx.run(
+            """
+            UNWIND $rows AS row
+            MATCH (a:__Entity__ {{id: row.source_id}}), (b:__Entity__ {{id: row.target_id}})
+            MERGE (a)-[r:{type}]->(b)
+            SET r += row.properties
+            FOREACH (_ IN CASE WHEN row.chunk_id IS NULL OR row.chunk_id IN coalesce(r.chunkIds, []) THEN [] ELSE [1] END |
+                SET r.chunkIds = coalesce(r.chunkIds, []) + row.chunk_id)
+            """.format(type=_quote(rel_type)),
+            rows=rows
+        ).consume()
+        return len(rows)
+
+    @staticmethod
+    def _write_mentions(tx, rows):
+        tx.run(
+            """
+            UNWIND $rows AS row
+            MATCH (c:Chunk {id: row.chunk_id})
+            MATCH (e:__Entity__ {id: row.entity_id})
+            MERGE (c)-[:MENTIONS]->(e)
+            """,
+            rows=rows
+        ).consume()
+
+    def save_document(self, document):
+        """Create or update the Document node; document is a dict with at least an id (the PDF sha256)."""
+        with self.driver.session() as session:
+            session.execute_write(
+                lambda tx: tx.run(
+                    """
+                    MERGE (d:Document {id: $id})
+                    SET d += $properties
+                    SET d.ingestedAt = datetime()
+                    """,
+                    id=document["id"],
+                    properties={key: value for key, value in document.items() if key != "id" and value is not None}
+                ).consume()
+            )
+
+    def save_chunks(self, document_id, chunks):
+        """Create the Chunk nodes of a document and link them with HAS_CHUNK. chunks are dicts with id, index and text."""
+        with self.driver.session() as session:
+            for batch in _batches(chunks, self.batch_size):
+                session.execute_write(
+                    lambda tx, rows: tx.run(
+                        """
+                        MATCH (d:Document {id: $document_id})
+                        UNWIND $rows AS row
+                        MERGE (c:Chunk {id: row.id})
+                        ON CREATE SET c.text = row.text, c.extracted = false
+                        MERGE (d)-[h:HAS_CHUNK]->(c)
+                        SET h.index = row.index
+                        """,
+                        document_id=document_id,
+                        rows=rows
+                    ).consume(),
+                    batch
+                )
+
+    def extracted_chunk_ids(self, chunk_ids):
+        """Return the subset of chunk ids whose graph has already been extracted and written."""
+        with self.driver.session() as session:
+            return session.execute_read(
+                lambda tx: {
+                    record["id"] for record in tx.run(
+                        """
+                        UNWIND $ids AS id
+                        MATCH (c:Chunk {id: id})
+                        WHERE c.extracted
+                        RETURN c.id AS id
+                        """,
+                        ids=list(chunk_ids)
+                    )
+                }
+            )
+
+    def mark_chunks_extracted(self, chunk_ids):
+        with self.driver.session() as session:
+            session.execute_write(
+                lambda tx: tx.run(
+                    """
+                    UNWIND $ids AS id
+                    MATCH (c:Chunk {id: id})
+                    SET c.extracted = true
+                    """,
+                    ids=list(chunk_ids)
+                ).consume()
+            )
+
+    def prune_document_chunks(self, document_id, keep_chunk_ids):
+        """Unlink the chunks of a document that are not in keep_chunk_ids and delete what only they supported."""
+        keep = list(keep_chunk_ids)
+        counts = {"chunks": 0, "relationships": 0, "entities": 0}
+        with self.driver.session() as session:
+            while True:
+                batch_counts = session.execute_write(self._delete_chunk_batch, document_id, self.delete_batch_size, keep)
+                if batch_counts is None:
+                    break
+                for key in counts:
+                    counts[key] += batch_counts[key]
+        return counts
+
+    def delete_document(self, document_id, progress=None):
+        """
+        Delete a Document node and every chunk, relationship and entity that only it supported.
+
+        Chunks are detached and deleted a batch at a time, each batch in its own bounded transaction,
+        so large documents do not hold locks or transaction memory for long and queries keep running.
+        A batch is detached and garbage collected in the same transaction, so an interrupted delete
+        leaves no unreachable chunks behind and can simply be retried.
+        progress, if given, is called as progress(stage, **counts) after each batch.
+        Returns the deletion counts, or None if there is no such document.
+        """
+        progress = progress or (lambda stage, **counts: None)
+        counts = {"chunks": 0, "relationships": 0, "entities": 0}
+        with self.driver.session() as session:
+            exists = session.execute_read(
+                lambda tx: tx.run("MATCH (d:Document {id: $id}) RETURN count(d) AS count", id=document_id).single()["count"]
+            )
+            if not exists:
+                return None
+
+            while True:
+                batch_counts = session.execute_write(self._delete_chunk_batch, document_id, self.delete_batch_size)
+                if batch_counts is None:
+                    break
+                for key in counts:
+                    counts[key] += batch_counts[key]
+                progress("deleting_graph", **{f"{key}_deleted": value for key, value in counts.items()})
+
+            session.execute_write(
+                lambda tx: tx.run("MATCH (d:Document {id: $id}) DETACH DELETE d", id=document_id).consume()
+            )
+        return counts
+
+    @classmethod
+    def _delete_chunk_batch(cls, tx, document_id, limit, keep=None):
+        """
+        Detach up to limit chunks of a document (except those in keep) and delete what only they supported.
+        Returns the deletion counts, or None when the document has no more chunks to detach.
+        """
+        chunk_ids = cls._detach_chunks(tx, document_id, limit, keep or [])
+        if not chunk_ids:
+            return None
+        return cls._delete_orphan_chunks(tx, chunk_ids)
+
+    @staticmethod
+    def _detach_chunks(tx, document_id, limit, keep):
+        return tx.run(
+            """
+            MATCH (:Document {id: $document_id})-[h:HAS_CHUNK]->(c:Chunk)
+            WHERE NOT c.id IN $keep
+            WITH h, c LIMIT $limit
+            DELETE h
+            RETURN collect(c.id) AS ids
+            """,
+            document_id=document_id,
+            keep=keep,
+            limit=limit
+        ).single()["ids"]
+
+    @staticmethod
+    def _delete_orphan_chunks(tx, chunk_ids):
+        relationships = tx.run(
+            """
+            UNWIND $ids AS id
+            MATCH (c:Chunk {id: id})
+            WHERE NOT EXISTS { (:Document)-[:HAS_CHUNK]->(c) }
+            MATCH (c)-[:MENTIONS]->(e:__Entity__)
+            // A separate MATCH, so self-loops (e)-[r]->(e) are found as well; the chunk mentions both endpoints
+            // of every relationship extracted from it, so starting from the source covers them all
+            MATCH (e)-[r]->(:__Entity__)
+            WHERE c.id IN coalesce(r.chunkIds, [])
+            SET r.chunkIds = [chunk_id IN r.chunkIds WHERE chunk_id <> c.id]
+            WITH DISTINCT r
+            WHERE size(r.chunkIds) = 0
+            DELETE r
+            """,
+            ids=chunk_ids
+        ).consume().counters.relationships_deleted
+
+        result = tx.run(
+            """
+            UNWIND $ids AS id
+            MATCH (c:Chunk {id: id})
+            WHERE NOT EXISTS { (:Document)-[:HAS_CHUNK]->(c) }
+            WITH c, [(c)-[:MENTIONS]->(e:__Entity__) | elementId(e)] AS entity_ids
+            DETACH DELETE c
+            RETURN entity_ids
+            """,
+            ids=chunk_ids
+        )
+        entity_ids = set()
+        for record in result:
+            entity_ids.update(record["entity_ids"])
+        chunks = result.consume().counters.nodes_deleted
+
+        entities = tx.run(
+            """
+            UNWIND $ids AS id
+            MATCH (e:__Entity__)
+            WHERE elementId(e) = id AND NOT EXISTS { (e)--() }
+            DELETE e
+            """,
+            ids=list(entity_ids)
+        ).consume().counters.nodes_deleted
+
+        return {"chunks": chunks, "relationships": relationships, "entities": entities}
@@ -0,0 +1,237 @@
+import os
+import shutil
+import socket
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+
+from pymongo import ReturnDocument
+
+from src.config.config import Config
+from src.config.logging_config import setup_logging
+from src.services.connection_registry import registry
+
+config = Config()
+logger = setup_logging(config.logging_config)
+
+
+class JobFailed(Exception):
+    """Raised by a runner to fail a job while still recording a (partial) result."""
+
+    def __init__(self, message, result=None):
+        super().__init__(message)
+        self.result = result
+
+
+class JobService:
+    """
+    In-process background job runner
+
+    Jobs are executed by a bounded thread pool and their state (status, stage,
+    progress, result and error) is persisted in MongoDB so it can be polled
+    from any worker and resumed after a restart. Job payloads are spooled to
+    local disk rather than stored in MongoDB. A periodic sweep (start_sweeper)
+    renews the heartbeat of the jobs running in this process and resumes the
+    jobs of workers that died.
+
+    A mongomock collection can be passed in place of the real one for tests.
+    """
+
+    ACTIVE_STATUSES = ["queued", "running"]
+
+    def __init__(self, collection=None, max_workers=None, spool_dir=None):
+        if collection is None:
+            collection = registry.mongo_client[config.mongo_jobs_db][config.mongo_jobs_collection]
+        self.jobs_collection = collection
+
+        self.spool_dir = spool_dir or config.job_spool_dir
+        os.makedirs(self.spool_dir, exist_ok=True)
+
+        self.hostname = socket.gethostname()
+        self.worker_id = f"{self.hostname}:{os.getpid()}"
+        self.executor = ThreadPoolExecutor(
+            max_workers=max_workers or config.ingestion_workers,
+            thread_name_prefix="ingestion-job"
+        )
+        self.runners = {}
+        # Ids submitted to the executor and not started yet, so a sweep does not queue them twice
+        self.scheduled = set()
+        self.lock = threading.Lock()
+
+    def register(self, job_type, runner):
+        """Register the callable that executes jobs of the given type: runner(job, progress) -> result."""
+        self.runners[job_type] = runner
+
+    def submit(self, job_type, payload=None, params=None, payload_file=None):
+        """
+        Persist a new job, spool its payload to disk and schedule it. Returns the job id.
+        payload_file is a file already on disk (ideally in the spool directory) that is moved into the job instead.
+        """
+        if job_type not in self.runners:
+            raise ValueError(f"No runner registered for job type '{job_type}'")
+
+        job_id = uuid.uuid4().hex
+        payload_path = None
+        if payload_file is not None:
+            payload_path = os.path.join(self.spool_dir, f"{job_id}.bin")
+            shutil.move(payload_file, payload_path)
+        elif payload is not None:
+            payload_path = os.path.join(self.spool_dir, f"{job_id}.bin")
+            with open(payload_path, "wb") as f:
+                f.write(payload)
+
+        now = datetime.utcnow()
+        self.jobs_collection.insert_one({
+            "_id": job_id,
+            "type": job_type,
+            "status": "queued",
+            "stage": "queued",
+            "progress": {},
+            "params": params or {},
+            "payloadPath": payload_path,
+            "result": None,
+            "error": None,
+            "createdAt": now,
+            "updatedAt": now
+        })
+
+        self._schedule(job_id)
+        logger.info(f"Submitted {job_type} job {job_id}")
+        return job_id
+
+    def get_job(self, job_id):
+        """Return the public view of a job, or None if it does not exist."""
+        job = self.jobs_collection.find_one({"_id": job_id}, {"payloadPath": 0, "worker": 0})
+        if not job:
+            return None
+
+        job["jobId"] = job.pop("_id")
+        for key in ("createdAt", "updatedAt", "startedAt", "finishedAt"):
+            if isinstance(job.get(key), datetime):
+                job[key] = job[key].isoformat()
+        return job
+
+    def resume_pending_jobs(self):
+        """
+        Re-schedule jobs left behind by other processes: queued jobs, running jobs claimed by a process of
+        this host that no longer exists, and running jobs whose heartbeat is older than the stale timeout.
+        The heartbeat of the jobs running in this process is renewed first. Returns the number scheduled.
+        """
+        now = datetime.utcnow()
+        self.jobs_collection.update_many(
+            {"status": "running", "worker": self.worker_id},
+            {"$set": {"updatedAt": now}}
+        )
+
+        requeue = {"$set": {"status": "queued", "stage": "queued", "updatedAt": now}}
+        stale_before = now - timedelta(seconds=config.job_stale_seconds)
+        self.jobs_collection.update_many({"status": "running", "updatedAt": {"$lt": stale_before}}, requeue)
+
+        dead = {
+            job.get("worker")
+            for job in self.jobs_collection.find({"status": "running"}, {"worker": 1})
+            if self._is_dead_local_worker(job.get("worker"))
+        }
+        if dead:
+            requeued = self.jobs_collection.update_many({"status": "running", "worker": {"$in": list(dead)}}, requeue)
+            logger.info(f"Re-queued {requeued.modified_count} jobs of exited workers {sorted(dead)}")
+
+        resumed = 0
+        for job in self.jobs_collection.find({"status": "queued"}, {"_id": 1}):
+            if self._schedule(job["_id"]):
+                resumed += 1
+
+        if resumed:
+            logger.info(f"Resumed {resumed} pending jobs")
+        return resumed
+
+    def start_sweeper(self, interval=None):
+        """Run resume_pending_jobs every JOB_SWEEP_SECONDS in a daemon thread."""
+        interval = interval or config.job_sweep_seconds
+
+        def sweep():
+            while True:
+                time.sleep(interval)
+                try:
+                    self.resume_pending_jobs()
+                except Exception as e:
+                    logger.error(f"Job sweep failed: {e}")
+
+        threading.Thread(target=sweep, name="job-sweeper", daemon=True).start()
+
+    def _is_dead_local_worker(self, worker):
+        """True if worker ("host:pid") names a process of this host that has exited."""
+        host, _, pid = (worker or "").rpartition(":")
+        if host != self.hostname or not pid.isdigit() or worker == self.worker_id:
+            return False
+        try:
+            os.kill(int(pid), 0)
+        except ProcessLookupError:
+            return True
+        except PermissionError:
+            # Exists, owned by another user
+            return False
+        return False
+
+    def _schedule(self, job_id):
+        with self.lock:
+            if job_id in self.scheduled:
+                return False
+            self.scheduled.add(job_id)
+        self.executor.submit(self._run, job_id)
+        return True
+
+    def _run(self, job_id):
+        with self.lock:
+            self.scheduled.discard(job_id)
+        job = self.jobs_collection.find_one({"_id": job_id})
+        if not job or job["status"] != "queued":
+            return
+
+        payload_path = job.get("payloadPath")
+        if payload_path and not os.path.exists(payload_path):
+            # The payload lives on another host's disk; leave the job for that host
+            logger.info(f"Payload for job {job_id} not found locally, skipping")
+            return
+
+        # Claim the job atomically so it runs only once across workers
+        now = datetime.utcnow()
+        job = self.jobs_collection.find_one_and_update(
+            {"_id": job_id, "status": "queued"},
+            {"$set": {"status": "running", "stage": "starting", "worker": self.worker_id,
+                      "startedAt": now, "updatedAt": now}},
+            return_document=ReturnDocument.AFTER
+        )
+        if not job:
+            return
+
+        runner = self.runners.get(job["type"])
+
+        def progress(stage, **counts):
+            update = {"stage": stage, "updatedAt": datetime.utcnow()}
+            for key, value in counts.items():
+                update[f"progress.{key}"] = value
+            self.jobs_collection.update_one({"_id": job_id}, {"$set": update})
+
+        try:
+            if runner is None:
+                raise ValueError(f"No runner registered for job type '{job['type']}'")
+            result = runner(job, progress)
+            self._finish(job_id, "succeeded", result=result)
+            logger.info(f"Job {job_id} succeeded")
+        except Exception as e:
+            logger.error(f"Job {job_id} failed: {e}", exc_info=True)
+            self._finish(job_id, "failed", result=getattr(e, "result", None), error=str(e))
+        finally:
+            if payload_path and os.path.exists(payload_path):
+                os.remove(payload_path)
+
+    def _finish(self, job_id, status, result=None, error=None):
+        now = datetime.utcnow()
+        self.jobs_collection.update_one(
+            {"_id": job_id},
+            {"$set": {"status": status, "stage": "finished", "result": result, "error": error,
+                      "finishedAt": now, "updatedAt": now}}
+        )
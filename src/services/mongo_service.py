@@ -1,16 +1,13 @@
-from pymongo import MongoClient
-from pymongo.server_api import ServerApi
-from src.config.config import Config
-
 from src.config.config import Config
 from src.config.logging_config import setup_logging
+from src.services.connection_registry import registry
 
 config = Config()
 logger = setup_logging(config.logging_config)
 
 class MongoDBHandler:
     def __init__(self):
-        self.client = MongoClient(config.mongo_uri)
+        self.client = registry.mongo_client
         self.glossary_db = self.client[config.mongo_glossary_db]
         self.glossary_collection = self.glossary_db[config.mongo_glossary_collection]
 
@@ -0,0 +1,147 @@
+import multiprocessing
+import threading
+from concurrent.futures import Future, ProcessPoolExecutor
+
+from src.config.config import Config
+from src.config.logging_config import setup_logging
+
+config = Config()
+logger = setup_logging(config.logging_config)
+
+# fitz and numpy are imported inside the worker functions so that importing this module stays cheap
+
+# PaddleOCR engine of the current process, created once and kept warm
+_ocr_engine = None
+
+
+def _get_engine():
+    global _ocr_engine
+    if _ocr_engine is None:
+        from paddleocr import PaddleOCR
+        _ocr_engine = PaddleOCR(use_angle_cls=True, lang="en")
+    return _ocr_engine
+
+
+def _warm_up():
+    _get_engine()
+
+
+def _open_pdf(pdf_source):
+    import fitz
+
+    if isinstance(pdf_source, (bytes, bytearray)):
+        return fitz.open("pdf", pdf_source)
+    return fitz.open(pdf_source)
+
+
+def render_page(page, dpi=None):
+    """
+    Render a page straight into a grayscale NumPy array backed by the pixmap sample buffer.
+    The pixmap is returned as well since the array does not own its memory.
+    """
+    import fitz
+    import numpy as np
+
+    zoom = (dpi or config.ocr_dpi) / 72
+    pix = page.get_pixmap(matrix=fitz.Matrix(zoom, zoom), colorspace=fitz.csGRAY, alpha=False)
+    image = np.ndarray(
+        shape=(pix.height, pix.width),
+        dtype=np.uint8,
+        buffer=pix.samples_mv,
+        strides=(pix.stride, 1)
+    )
+    return image, pix
+
+
+def _lines_to_text(lines):
+    return "".join(f"{line}\n" for line in lines)
+
+
+def _recognize(engine, images):
+    """OCR a list of images, in one call when the engine supports batched input."""
+    import numpy as np
+
+    if hasattr(engine, "predict"):
+        # PaddleOCR 3.x takes a list of 3-channel images
+        results = engine.predict([np.repeat(image[:, :, None], 3, axis=2) for image in images])
+        return [_lines_to_text(result["rec_texts"]) for result in results]
+
+    # PaddleOCR 2.x takes one image per call and converts grayscale input itself
+    texts = []
+    for image in images:
+        results = engine.ocr(image, cls=True)
+        lines = [line[1][0] for line in results[0]] if results and results[0] else []
+        texts.append(_lines_to_text(lines))
+    return texts
+
+
+def ocr_pages(pdf_source, page_numbers, dpi=None, batch_size=None):
+    """OCR the given pages of a PDF (bytes or path) and return their text in the same order."""
+    engine = _get_engine()
+    batch_size = batch_size or config.ocr_batch_size
+    page_numbers = list(page_numbers)
+
+    texts = []
+    pdf_document = _open_pdf(pdf_source)
+    try:
+        for start in range(0, len(page_numbers), batch_size):
+            rendered = [render_page(pdf_document.load_page(page_num), dpi)
+                        for page_num in page_numbers[start:start + batch_size]]
+            texts.extend(_recognize(engine, [image for image, _ in rendered]))
+            del rendered
+    finally:
+        pdf_document.close()
+    return texts
+
+
+class OcrService:
+    """
+    Runs PaddleOCR over PDF pages in a pool of worker processes
+
+    Each worker process loads its own PaddleOCR instance on start and keeps it
+    for the life of the pool. With max_workers set to 0 pages are OCRed in the
+    calling process instead, which is what daemonic pool workers must use.
+    """
+
+    def __init__(self, max_workers=None, start_method=None):
+        self.max_workers = config.ocr_workers if max_workers is None else max_workers
+        self.start_method = start_method or config.ocr_start_method
+        self.executor = None
+        self.lock = threading.Lock()
+
+    def _get_executor(self):
+        with self.lock:
+            if self.executor is None:
+                self.executor = ProcessPoolExecutor(
+                    max_workers=self.max_workers,
+                    mp_context=multiprocessing.get_context(self.start_method),
+                    initializer=_get_engine
+                )
+                logger.info(f"Started OCR pool with {self.max_workers} worker processes")
+            return self.executor
+
+    def submit(self, pdf_source, page_numbers):
+        """Schedule OCR of the given pages; the future resolves to their texts in page order."""
+        if self.max_workers == 0:
+            future = Future()
+            try:
+                future.set_result(ocr_pages(pdf_source, page_numbers))
+            except Exception as e:
+                future.set_exception(e)
+            return future
+        return self._get_executor().submit(ocr_pages, pdf_source, list(page_numbers))
+
+    def warm_up(self):
+        """Start the worker processes and load their OCR engines."""
+        if self.max_workers == 0:
+            _get_engine()
+            return
+        executor = self._get_executor()
+        for future in [executor.submit(_warm_up) for _ in range(self.max_workers)]:
+            future.result()
+
+    def shutdown(self):
+        with self.lock:
+            if self.executor is not None:
+                self.executor.shutdown(wait=True)
+                self.executor = None
@@ -0,0 +1,128 @@
+import re
+import threading
+import time
+from collections import OrderedDict
+
+from src.config.config import Config
+from src.config.logging_config import setup_logging
+from src.services.version_service import version_service
+
+config = Config()
+logger = setup_logging(config.logging_config)
+
+
+class TTLCache:
+    """LRU cache whose entries also expire after a fixed time to live."""
+
+    def __init__(self, max_entries, ttl_seconds):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.saved_seconds = 0.0
+
+    def get(self, key):
+        """Return (True, value) on a hit and (False, None) on a miss."""
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is None or entry[1] < time.monotonic():
+                if entry is not None:
+                    del self.entries[key]
+                self.misses += 1
+                return False, None
+
+            self.entries.move_to_end(key)
+            self.hits += 1
+            # Credit the time it took to compute the value in the first place
+            self.saved_seconds += entry[2]
+            return True, entry[0]
+
+    def put(self, key, value, cost_seconds=0.0):
+        with self.lock:
+            self.entries[key] = (value, time.monotonic() + self.ttl_seconds, cost_seconds)
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.max_entries:
+                self.entries.popitem(last=False)
+
+    def stats(self):
+        with self.lock:
+            lookups = self.hits + self.misses
+            return {
+                "entries": len(self.entries),
+                "hits": self.hits,
+                "misses": self.misses,
+                "hitRate": self.hits / lookups if lookups else 0.0,
+                "latencySavedSeconds": round(self.saved_seconds, 3)
+            }
+
+
+class QueryCache:
+    """
+    Layered cache for the question answering pipeline
+
+    Extracted entities, retrieved graph context and final answers are cached
+    per normalized question. Keys carry the graph version (and for answers the
+    glossary version as well), so bumping a version invalidates every entry
+    that depended on it. Results of an in-memory matcher depend on the version
+    it was built from rather than the current one, which a register_version()
+    source reports; a key taken with key() before computing a value is never
+    newer than the data the value was computed from.
+    """
+
+    # Versions each layer depends on; "gazetteer" is the graph version the entity gazetteer was built from
+    LAYERS = {
+        "entities": ("graph", "gazetteer"),
+        "context": ("graph", "gazetteer"),
+        "answer": ("graph", "gazetteer", "glossary"),
+    }
+
+    def __init__(self, max_entries=None, ttl_seconds=None, versions=None):
+        max_entries = max_entries or config.query_cache_max_entries
+        ttl_seconds = ttl_seconds or config.query_cache_ttl_seconds
+        self.versions = versions or version_service
+        # Version name -> callable returning the version of the data actually in use
+        self.sources = {}
+        self.layers = {layer: TTLCache(max_entries, ttl_seconds) for layer in self.LAYERS}
+
+    def register_version(self, name, source):
+        """Read the version called name from source() instead of the version service."""
+        self.sources[name] = source
+
+    @staticmethod
+    def normalize_question(question):
+        """Case-fold, collapse whitespace and drop trailing punctuation so near-identical questions share entries."""
+        normalized = " ".join(str(question).casefold().split())
+        return re.sub(r"[\s?.!]+$", "", normalized)
+
+    def _version(self, name):
+        source = self.sources.get(name)
+        return source() if source is not None else self.versions.get(name)
+
+    def key(self, layer, question):
+        """Cache key of the question in the layer for the versions in use right now."""
+        versions = tuple(self._version(name) for name in self.LAYERS[layer])
+        return versions, self.normalize_question(question)
+
+    def get(self, layer, question, key=None):
+        return self.layers[layer].get(key or self.key(layer, question))
+
+    def put(self, layer, question, value, cost_seconds=0.0, key=None):
+        """Store the value; pass the key taken before computing it so it is not filed under newer versions."""
+        self.layers[layer].put(key or self.key(layer, question), value, cost_seconds)
+
+    def get_or_compute(self, layer, question, compute):
+        """Return the cached value for the question, computing and storing it on a miss."""
+        key = self.key(layer, question)
+        found, value = self.layers[layer].get(key)
+        if found:
+            return value
+
+        start = time.perf_counter()
+        value = compute()
+        self.layers[layer].put(key, value, time.perf_counter() - start)
+        return value
+
+    def stats(self):
+        return {layer: cache.stats() for layer, cache in self.layers.items()}
@@ -1,16 +1,22 @@
-from azure.storage.blob import BlobServiceClient, BlobClient, ContainerClient, ContentSettings
+from azure.core.exceptions import ResourceNotFoundError
+from azure.storage.blob import ContentSettings
+from bson import ObjectId
+from bson.errors import InvalidId
 from werkzeug.utils import secure_filename
 
 from src.config.config import Config
 from src.config.logging_config import setup_logging
-from src.services.mongo_service import MongoDBHandler
-from azure.storage.blob import BlobServiceClient
-from pymongo.mongo_client import MongoClient
-from pymongo.server_api import ServerApi
+from src.services.connection_registry import registry
+import base64
 import hashlib
-import io
+import json
+import os
+import re
+import tempfile
 from datetime import datetime
 import PyPDF2
+from pymongo import ASCENDING, DESCENDING
+from pymongo.errors import DuplicateKeyError
 
 config = Config()
 logger = setup_logging(config.logging_config)
@@ -19,7 +25,7 @@ logger = setup_logging(config.logging_config)
 class StorageService:
     def __init__(self):
         try:
-            self.blob_service_client = BlobServiceClient.from_connection_string(config.azure_connection_string)
+            self.blob_service_client = registry.blob_service_client
             self.container_client = self.blob_service_client.get_container_client(config.azure_container_name)
             logger.info("Successfully connected to Azure storage container")
         except Exception as e:
@@ -27,7 +33,7 @@ class StorageService:
             raise
 
         # Mongo config
-        self.mongo_client = MongoClient(config.mongo_uri)
+        self.mongo_client = registry.mongo_client
         self.metadata_db = self.mongo_client[config.mongo_metadata_db]
         self.metadata_collection = self.metadata_db[config.mongo_metadata_collection]
 
@@ -37,6 +43,26 @@ class StorageService:
             logger.error(f"MongoDB connection error: {e}")
             raise
 
+    def ensure_indexes(self):
+        """
+        Create the indexes behind the duplicate check and the paginated listing (newest first,
+        optionally filtered by file type or filename prefix). Run by migrate.py or after startup.
+        """
+        try:
+            self.metadata_collection.create_index([("uploadDate", DESCENDING), ("_id", DESCENDING)],
+                                                  name="uploadDate_id")
+            self.metadata_collection.create_index([("fileType", ASCENDING), ("uploadDate", DESCENDING),
+                                                   ("_id", DESCENDING)], name="fileType_uploadDate_id")
+            self.metadata_collection.create_index("filename", name="filename")
+        except Exception as e:
+            logger.error(f"Unable to create document listing indexes: {e}")
+
+        try:
+            self.metadata_collection.create_index("hash", name="hash_unique", unique=True)
+        except Exception as e:
+            # Typically duplicate hashes stored before the index existed
+            logger.error(f"Unable to create unique index on document hash: {e}")
+
     # def upload_pdf_and_metadata(self, file):
     #     pdf_bytes = file.read()
     #
@@ -76,67 +102,223 @@ class StorageService:
     from werkzeug.utils import secure_filename
     from datetime import datetime
     import hashlib
-    import io
     import PyPDF2
     from azure.storage.blob import ContentSettings
 
-    def upload_pdf_and_metadata(self, pdf_bytes, original_filename, content_type):
+    @staticmethod
+    def spool_upload(stream, directory=None):
+        """
+        Copy an upload stream to a temporary file in fixed-size reads, hashing it on the way,
+        so the body is never held in memory. Returns (path, SHA-256 hex digest, size); the caller owns the file.
+        """
+        directory = directory or config.job_spool_dir
+        os.makedirs(directory, exist_ok=True)
+
+        digest = hashlib.sha256()
+        size = 0
+        fd, path = tempfile.mkstemp(suffix=".upload", dir=directory)
+        try:
+            with os.fdopen(fd, "wb") as f:
+                while True:
+                    block = stream.read(config.upload_read_size)
+                    if not block:
+                        break
+                    digest.update(block)
+                    f.write(block)
+                    size += len(block)
+        except Exception:
+            os.remove(path)
+            raise
+        return path, digest.hexdigest(), size
+
+    def upload_pdf_and_metadata(self, pdf_path, original_filename, content_type, document_hash=None, file_size=None,
+                                document_id=None, extra_metadata=None):
         """
-        Uploads a PDF (given as bytes) to Azure Blob Storage and stores metadata in MongoDB.
+        Uploads a PDF (given as a file path, see spool_upload) to Azure Blob Storage and stores metadata in MongoDB.
+        The file is read in blocks and uploaded as staged blocks in parallel, so memory use does not grow with its size.
+        document_id fixes the id of the metadata record, so it can be handed out before the upload finishes.
         """
 
         # Generate SHA-256 hash to detect duplicates
-        document_hash = hashlib.sha256(pdf_bytes).hexdigest()
+        if document_hash is None:
+            with open(pdf_path, "rb") as f:
+                digest = hashlib.sha256()
+                for block in iter(lambda: f.read(config.upload_read_size), b""):
+                    digest.update(block)
+            document_hash = digest.hexdigest()
+        if file_size is None:
+            file_size = os.path.getsize(pdf_path)
 
         # Check if document already exists in MongoDB
         existing = self.metadata_collection.find_one({"hash": document_hash})
         if existing:
-            return {"error": "Document already uploaded"}, 409
+            return {"error": "Document already uploaded", "documentId": str(existing["_id"])}, 409
 
-        # Extract metadata using PyPDF2
-        pdf_stream = io.BytesIO(pdf_bytes)
-        pdf_reader = PyPDF2.PdfReader(pdf_stream)
+        # Extract metadata using PyPDF2, which reads the objects it needs from the file
+        with open(pdf_path, "rb") as pdf_stream:
+            number_of_pages = len(PyPDF2.PdfReader(pdf_stream).pages)
 
         metadata = {
             "filename": secure_filename(original_filename),
-            "numberOfPages": len(pdf_reader.pages),
+            "numberOfPages": number_of_pages,
             "hash": document_hash,
-            "fileSize": len(pdf_bytes),
+            "fileSize": file_size,
             "fileType": content_type,
             "uploadDate": datetime.now()
         }
+        if document_id is not None:
+            metadata["_id"] = ObjectId(document_id)
+        metadata.update(extra_metadata or {})
 
         # Upload to Azure Blob Storage
         blob_name = f"{document_hash}_{secure_filename(original_filename)}"
         blob_client = self.container_client.get_blob_client(blob_name)
 
-        blob_client.upload_blob(
-            data=io.BytesIO(pdf_bytes),
-            overwrite=True,
-            content_settings=ContentSettings(content_type=content_type)
-        )
+        with open(pdf_path, "rb") as data:
+            blob_client.upload_blob(
+                data=data,
+                length=file_size,
+                overwrite=True,
+                max_concurrency=config.azure_upload_concurrency,
+                content_settings=ContentSettings(content_type=content_type)
+            )
 
         metadata["azureBlobUrl"] = blob_client.url
         metadata["azureBlobName"] = blob_name
 
         # Save metadata to MongoDB
-        inserted_id = self.metadata_collection.insert_one(metadata).inserted_id
+        try:
+            inserted_id = self.metadata_collection.insert_one(metadata).inserted_id
+        except DuplicateKeyError:
+            # The same content was stored concurrently under another record
+            existing = self.find_by_hash(document_hash)
+            if existing is None:
+                raise
+            if existing.get("azureBlobName") != blob_name:
+                blob_client.delete_blob()
+            return {"error": "Document already uploaded", "documentId": str(existing["_id"])}, 409
 
         return {"documentId": str(inserted_id)}, 200
 
-    def list_documents(self):
-        documents = list(self.metadata_collection.find({}, {
+    def get_document(self, document_id):
+        """Return the metadata record of a document, or None if the id is unknown or malformed."""
+        try:
+            return self.metadata_collection.find_one({"_id": ObjectId(document_id)})
+        except InvalidId:
+            return None
+
+    def find_by_hash(self, document_hash):
+        return self.metadata_collection.find_one({"hash": document_hash})
+
+    def set_graph_status(self, document_id, status, **details):
+        """Record the state of the document's knowledge graph (processing, succeeded or failed) on its metadata."""
+        self.metadata_collection.update_one(
+            {"_id": ObjectId(document_id)},
+            {"$set": {"graph": {"status": status, "updatedAt": datetime.now(), **details}}}
+        )
+
+    def download_pdf(self, document, directory=None):
+        """
+        Download the stored PDF of a document to a temporary file, streaming it in chunks.
+        Returns the path; the caller owns the file.
+        """
+        directory = directory or config.job_spool_dir
+        os.makedirs(directory, exist_ok=True)
+
+        blob_client = self.container_client.get_blob_client(document["azureBlobName"])
+        fd, path = tempfile.mkstemp(suffix=".pdf", dir=directory)
+        try:
+            with os.fdopen(fd, "wb") as f:
+                blob_client.download_blob(max_concurrency=config.azure_upload_concurrency).readinto(f)
+        except Exception:
+            os.remove(path)
+            raise
+        return path
+
+    def mark_document(self, document, status):
+        self.metadata_collection.update_one({"_id": document["_id"]}, {"$set": {"status": status}})
+
+    def delete_document(self, document):
+        """Delete the stored PDF and the metadata record of a document. A missing blob is not an error."""
+        try:
+            self.container_client.delete_blob(document["azureBlobName"], delete_snapshots="include")
+        except ResourceNotFoundError:
+            logger.info(f"Blob {document['azureBlobName']} was already deleted")
+        self.metadata_collection.delete_one({"_id": document["_id"]})
+
+    def list_documents(self, limit=None, cursor=None, filename=None, file_type=None):
+        """
+        Return one page of documents, newest first, as a DocumentPage read lazily from MongoDB.
+        cursor is the nextCursor of the previous page; filename filters on a filename prefix.
+        Raises ValueError for an invalid cursor or limit.
+        """
+        limit = config.documents_page_size if limit is None else int(limit)
+        if not 1 <= limit <= config.documents_max_page_size:
+            raise ValueError(f"limit must be between 1 and {config.documents_max_page_size}")
+
+        query = {"status": {"$ne": "deleting"}}
+        if file_type:
+            query["fileType"] = file_type
+        if filename:
+            query["filename"] = {"$regex": "^" + re.escape(filename)}
+        if cursor:
+            upload_date, last_id = self.decode_cursor(cursor)
+            query["$or"] = [
+                {"uploadDate": {"$lt": upload_date}},
+                {"uploadDate": upload_date, "_id": {"$lt": last_id}}
+            ]
+
+        # One extra document tells whether there is a next page
+        documents = self.metadata_collection.find(query, {
             '_id': 1, 'filename': 1, 'numberOfPages': 1, 'fileSize': 1,
-            'fileType': 1, 'uploadDate': 1, 'azureBlobUrl': 1, 'azureBlobName': 1
-        }))
+            'fileType': 1, 'uploadDate': 1, 'azureBlobUrl': 1, 'azureBlobName': 1, 'graph': 1
+        }).sort([("uploadDate", DESCENDING), ("_id", DESCENDING)]).limit(limit + 1)
+        return DocumentPage(documents, limit)
+
+    @staticmethod
+    def encode_cursor(doc):
+        position = {"uploadDate": doc["uploadDate"].isoformat(), "id": str(doc["_id"])}
+        return base64.urlsafe_b64encode(json.dumps(position).encode("utf-8")).decode("ascii")
+
+    @staticmethod
+    def decode_cursor(cursor):
+        try:
+            position = json.loads(base64.urlsafe_b64decode(cursor.encode("ascii")))
+            return datetime.fromisoformat(position["uploadDate"]), ObjectId(position["id"])
+        except Exception:
+            raise ValueError("Invalid cursor")
+
+
+class DocumentPage:
+    """
+    One page of the document listing. Iterating yields the documents serialized for JSON;
+    afterwards next_cursor holds the cursor of the following page, or None on the last page.
+    """
 
-        if not documents:
-            return {"error": "No documents found"}, 404
+    def __init__(self, documents, limit):
+        self.documents = documents
+        self.limit = limit
+        self.next_cursor = None
 
-        for doc in documents:
-            doc['_id'] = str(doc['_id'])
-            if isinstance(doc.get('uploadDate'), datetime):
-                doc['uploadDate'] = doc['uploadDate'].isoformat()
-            doc['downloadUrl'] = doc['azureBlobUrl']
+    def __iter__(self):
+        count = 0
+        last = None
+        for doc in self.documents:
+            if count == self.limit:
+                self.next_cursor = StorageService.encode_cursor(last)
+                break
+            last = doc
+            count += 1
+            yield self.serialize(doc)
+        self.documents.close()
 
-        return {"documents": documents}, 200
\ No newline at end of file
+    @staticmethod
+    def serialize(doc):
+        doc = dict(doc)
+        doc['_id'] = str(doc['_id'])
+        if isinstance(doc.get('uploadDate'), datetime):
+            doc['uploadDate'] = doc['uploadDate'].isoformat()
+        if isinstance(doc.get('graph'), dict) and isinstance(doc['graph'].get('updatedAt'), datetime):
+            doc['graph'] = {**doc['graph'], 'updatedAt': doc['graph']['updatedAt'].isoformat()}
+        doc['downloadUrl'] = doc.get('azureBlobUrl')
+        return doc
@@ -0,0 +1,105 @@
+import threading
+
+import ahocorasick
+
+
+def _is_word_char(char):
+    return char.isalnum() or char == "_"
+
+
+class _Automaton:
+    """
+    Aho-Corasick automaton over a fixed set of terms; never modified once built.
+    Backed by pyahocorasick, whose C trie takes a small fraction of the memory of a dict per state.
+    """
+
+    def __init__(self, terms):
+        self.automaton = ahocorasick.Automaton()
+        for term, keys in terms.items():
+            self.automaton.add_word(term, (tuple(keys), len(term)))
+        if terms:
+            self.automaton.make_automaton()
+
+    def find(self, normalized):
+        found = []
+        seen = set()
+        if self.automaton.kind != ahocorasick.AHOCORASICK:
+            return found
+
+        # Matches come in order of their end position, including terms found through failure links
+        for end, (keys, length) in self.automaton.iter(normalized):
+            start = end - length + 1
+            # Reject matches that start or end inside a word
+            if start > 0 and _is_word_char(normalized[start - 1]) and _is_word_char(normalized[start]):
+                continue
+            if end + 1 < len(normalized) and _is_word_char(normalized[end + 1]) and _is_word_char(normalized[end]):
+                continue
+            for key in keys:
+                if key not in seen:
+                    seen.add(key)
+                    found.append(key)
+        return found
+
+
+class TermMatcher:
+    """
+    Aho-Corasick automaton over a set of terms
+
+    Finds every term that occurs in a text as a whole word (case-insensitive)
+    in a single pass, so matching cost depends on the length of the text and
+    not on the number of terms. Terms can be added at any time and are matched
+    once build() has run: it builds a new automaton without blocking find(),
+    which keeps using the previous one until the new one is swapped in.
+    """
+
+    def __init__(self, terms=None):
+        # Normalized term -> keys reported when it matches
+        self.terms = {}
+        self.size = 0
+        self.dirty = False
+        self.automaton = None
+        # Guards terms; build_lock lets one build run at a time
+        self.lock = threading.Lock()
+        self.build_lock = threading.Lock()
+        for term in terms or []:
+            self.add(term)
+
+    def __len__(self):
+        return self.size
+
+    @staticmethod
+    def normalize(text):
+        return text.casefold()
+
+    def add(self, term, key=None):
+        """Add a term; matches report key, which defaults to the normalized term."""
+        normalized = self.normalize(term).strip()
+        if not normalized:
+            return
+        key = normalized if key is None else key
+
+        with self.lock:
+            keys = self.terms.setdefault(normalized, [])
+            if key not in keys:
+                keys.append(key)
+                self.size += 1
+            self.dirty = True
+
+    def build(self):
+        """Build an automaton over the terms added so far and swap it in, if any were added since the last build."""
+        with self.build_lock:
+            with self.lock:
+                if not self.dirty and self.automaton is not None:
+                    return
+                terms = {term: list(keys) for term, keys in self.terms.items()}
+                self.dirty = False
+            # Built outside the lock; find() reads self.automaton once, so the swap is atomic for it
+            self.automaton = _Automaton(terms)
+
+    def find(self, text):
+        """Return the keys of all terms found in the text as whole words, in order of first occurrence."""
+        automaton = self.automaton
+        if automaton is None:
+            self.build()
+            automaton = self.automaton
+        return automaton.find(self.normalize(text))
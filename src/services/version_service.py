@@ -0,0 +1,91 @@
+import threading
+import time
+
+from pymongo import ReturnDocument
+
+from src.config.config import Config
+from src.config.logging_config import setup_logging
+from src.services.connection_registry import registry
+
+config = Config()
+logger = setup_logging(config.logging_config)
+
+
+class VersionService:
+    """
+    Named version counters shared by all workers through MongoDB
+
+    Ingestion bumps "graph" and glossary writes bump "glossary"; caches include
+    the current versions in their keys so a bump invalidates them everywhere.
+    Reads are served from a local copy; once it is older than a few seconds it
+    is refreshed by a background thread, one per counter at a time, so a slow
+    or failing MongoDB never stalls the query path.
+    """
+
+    def __init__(self, collection=None):
+        self._collection = collection
+        self.local = {}
+        self.checked_at = {}
+        self.refreshing = set()
+        self.lock = threading.Lock()
+
+    @property
+    def collection(self):
+        if self._collection is None:
+            self._collection = registry.mongo_client[config.mongo_metadata_db][config.mongo_versions_collection]
+        return self._collection
+
+    def get(self, name):
+        """
+        Return the current value of the counter. The local copy is returned right away and refreshed in the
+        background when older than VERSION_CHECK_SECONDS; only the first read of a counter waits for MongoDB.
+        """
+        if name not in self.local:
+            with self.lock:
+                first = name not in self.refreshing and name not in self.local
+                if first:
+                    self.refreshing.add(name)
+            if first:
+                self._refresh(name)
+            # Concurrent first readers do not queue up behind MongoDB
+            return self.local.get(name, 0)
+
+        if time.monotonic() - self.checked_at.get(name, 0) >= config.version_check_seconds:
+            with self.lock:
+                start = name not in self.refreshing
+                if start:
+                    self.refreshing.add(name)
+            if start:
+                threading.Thread(target=self._refresh, args=(name,), daemon=True).start()
+        return self.local[name]
+
+    def _refresh(self, name):
+        try:
+            doc = self.collection.find_one({"_id": name})
+            value = doc["value"] if doc else 0
+        except Exception as e:
+            # Keep serving the last known version while MongoDB is unavailable
+            logger.error(f"Unable to read version '{name}': {e}")
+            value = self.local.get(name, 0)
+
+        with self.lock:
+            self.local[name] = value
+            self.checked_at[name] = time.monotonic()
+            self.refreshing.discard(name)
+
+    def bump(self, name):
+        """Increment the counter and return its new value."""
+        doc = self.collection.find_one_and_update(
+            {"_id": name},
+            {"$inc": {"value": 1}},
+            upsert=True,
+            return_document=ReturnDocument.AFTER
+        )
+        with self.lock:
+            self.local[name] = doc["value"]
+            self.checked_at[name] = time.monotonic()
+        logger.info(f"Version '{name}' bumped to {doc['value']}")
+        return doc["value"]
+
+
+version_service = VersionService()
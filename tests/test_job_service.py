@@ -0,0 +1,106 @@
+import os
+import subprocess
+import sys
+from datetime import datetime, timedelta
+
+import pytest
+
+mongomock = pytest.importorskip("mongomock")
+
+from src.services.job_service import JobFailed, JobService
+
+
+@pytest.fixture
+def jobs(tmp_path):
+    collection = mongomock.MongoClient().db.jobs
+    return JobService(collection=collection, max_workers=1, spool_dir=str(tmp_path))
+
+
+def wait(service):
+    service.executor.shutdown(wait=True)
+
+
+def insert_running(service, job_id, worker, updated_at=None):
+    service.jobs_collection.insert_one({
+        "_id": job_id, "type": "echo", "status": "running", "stage": "extracting", "progress": {},
+        "params": {}, "payloadPath": None, "result": None, "error": None, "worker": worker,
+        "createdAt": datetime.utcnow(), "updatedAt": updated_at or datetime.utcnow()
+    })
+
+
+def exited_pid():
+    process = subprocess.Popen([sys.executable, "-c", "pass"])
+    process.wait()
+    return process.pid
+
+
+def test_submit_runs_the_job_and_removes_its_payload(jobs):
+    seen = {}
+
+    def runner(job, progress):
+        with open(job["payloadPath"], "rb") as f:
+            seen["payload"] = f.read()
+        progress("extracting", chunks=3)
+        return {"params": job["params"]}
+
+    jobs.register("echo", runner)
+    job_id = jobs.submit("echo", payload=b"pdf", params={"filename": "a.pdf"})
+    wait(jobs)
+
+    job = jobs.get_job(job_id)
+    assert seen["payload"] == b"pdf"
+    assert job["status"] == "succeeded"
+    assert job["progress"] == {"chunks": 3}
+    assert job["result"] == {"params": {"filename": "a.pdf"}}
+    assert "worker" not in job and "payloadPath" not in job
+    assert os.listdir(jobs.spool_dir) == []
+
+
+def test_failed_job_records_error_and_partial_result(jobs):
+    def runner(job, progress):
+        raise JobFailed("upload failed", result={"outcome": "upload_failed"})
+
+    jobs.register("echo", runner)
+    job_id = jobs.submit("echo")
+    wait(jobs)
+
+    job = jobs.get_job(job_id)
+    assert job["status"] == "failed"
+    assert job["error"] == "upload failed"
+    assert job["result"] == {"outcome": "upload_failed"}
+
+
+def test_job_claimed_elsewhere_is_not_run(jobs):
+    calls = []
+    jobs.register("echo", lambda job, progress: calls.append(job["_id"]))
+    insert_running(jobs, "claimed", "other-host:1")
+
+    jobs._run("claimed")
+
+    assert calls == []
+    assert jobs.get_job("claimed")["status"] == "running"
+
+
+def test_resume_requeues_jobs_of_exited_and_stale_workers(jobs):
+    calls = []
+    jobs.register("echo", lambda job, progress: calls.append(job["_id"]))
+    stale = datetime.utcnow() - timedelta(days=1)
+    insert_running(jobs, "exited", f"{jobs.hostname}:{exited_pid()}")
+    insert_running(jobs, "stale", "other-host:1", updated_at=stale)
+    insert_running(jobs, "alive", "other-host:1")
+    insert_running(jobs, "own", jobs.worker_id, updated_at=stale)
+
+    assert jobs.resume_pending_jobs() == 2
+    wait(jobs)
+
+    assert sorted(calls) == ["exited", "stale"]
+    assert jobs.get_job("alive")["status"] == "running"
+    own = jobs.jobs_collection.find_one({"_id": "own"})
+    assert own["status"] == "running" and own["updatedAt"] > stale
+
+
+def test_resume_does_not_schedule_a_queued_job_twice(jobs):
+    jobs.scheduled.add("queued")
+    jobs.jobs_collection.insert_one({"_id": "queued", "type": "echo", "status": "queued"})
+
+    assert jobs.resume_pending_jobs() == 0